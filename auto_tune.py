@@ -0,0 +1,91 @@
+'''
+Finds the frequency the fingerprint sensor radiates on and tunes the
+receiver config to it.
+SdrReceiver.sweep() steps the dongle across a range with short dwells and
+ranks the frequencies; with --key, the sensor is pulsed continuously (the
+reference pattern: a burst every symbol period) during half of each dwell,
+so the sensor's emission is told apart from broadcast transmitters by how
+much the keying raises it. The winner is saved to receiver_config.json,
+which sdr.py and sdr_read_write.py load through radio_config.py.
+'''
+
+import argparse
+import threading
+
+from modulator import FMDevice, PULSE_TIMEOUT
+from radio_config import FREQUENCY, SAMPLE_RATE
+from sdr import SWEEP_DWELL_MS, SdrReceiver
+
+# default sweep: 25 MHz either side of the configured frequency
+SWEEP_SPAN = 25e6
+
+# longest PulseKeyer.start() waits for the first pulse, in seconds
+KEYER_START_TIMEOUT = 2.0
+
+class PulseKeyer:
+    """
+    Pulses fm back to back on a thread between start() and stop().
+    start() returns once the first pulse is under way, so whatever is
+    measured after it sees the sensor keyed.
+
+    """
+    def __init__(self, fm):
+        self.fm = fm
+        self.pulses = 0
+        self.__running = threading.Event()
+        self.__pulsing = threading.Event()
+        self.__thread = None
+
+    def __run(self):
+        while self.__running.is_set():
+            self.__pulsing.set()
+            self.fm.pulse()
+            self.pulses += 1
+
+    def start(self, timeout=KEYER_START_TIMEOUT):
+        '''
+        returns False if no pulse began within timeout seconds
+        '''
+        self.__pulsing.clear()
+        self.__running.set()
+        self.__thread = threading.Thread(target=self.__run, name="keyer",
+                                         daemon=True)
+        self.__thread.start()
+        return self.__pulsing.wait(timeout)
+
+    def stop(self):
+        self.__running.clear()
+        # a pulse in progress is cut short
+        self.fm.cancel()
+        self.__thread.join()
+
+def main():
+  parser = argparse.ArgumentParser(description='Sweep the RTL-SDR for the fingerprint sensor and save the best frequency.')
+  parser.add_argument('--start', type=float, default=FREQUENCY - SWEEP_SPAN, help='lowest frequency in Hz (default=%(default)s)')
+  parser.add_argument('--stop', type=float, default=FREQUENCY + SWEEP_SPAN, help='highest frequency in Hz (default=%(default)s)')
+  parser.add_argument('-r', '--rate', type=float, default=SAMPLE_RATE, help='sample rate (default=%(default)s)')
+  parser.add_argument('-d', '--dwell', type=float, default=SWEEP_DWELL_MS, help='ms measured per step (default=%(default)s)')
+  parser.add_argument('-k', '--key', action='store_true', help='pulse the sensor during the sweep and rank by the difference')
+  parser.add_argument('-n', '--count', type=int, default=5, help='candidates to list (default=%(default)s)')
+  parser.add_argument('--no-save', action='store_true', help='do not write receiver_config.json')
+  args = parser.parse_args()
+
+  fm = FMDevice(PULSE_TIMEOUT) if args.key else None
+  receiver = SdrReceiver(FREQUENCY, args.rate)
+  try:
+    candidates = receiver.sweep(args.start, args.stop, args.dwell,
+                                keyer=PulseKeyer(fm) if fm else None,
+                                count=args.count, save=not args.no_save)
+  finally:
+    receiver.close()
+    if fm is not None:
+      fm.close()
+  for c in candidates:
+    print("{:.4f} MHz  score {:+.1f} dB  power {:.1f} dB".format(
+      c.frequency / 1e6, c.score_db, c.power_db))
+  if candidates and not args.no_save:
+    print("receiver tuned to {:.4f} MHz".format(candidates[0].frequency / 1e6))
+
+
+if __name__ == '__main__':
+  main()
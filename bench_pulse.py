@@ -0,0 +1,100 @@
+'''
+Microbenchmark for the host side of one pulse.
+It compares the old FMDevice.test() path, which built a new ABS_OPERATION,
+callback thunk and image pointer and called an untyped ABSGrabImage for
+every "1", with the prepared path that builds them once per session.
+The sensor is replaced by a stand-in grab function that returns a timeout
+immediately, so only the Python/ctypes overhead is measured.
+'''
+
+from ctypes import *
+import argparse
+import time
+
+import numpy as np
+from fprint_codes import ABS_STATUS_TIMEOUT
+from modulator import (ABS_IMAGE, ABS_IMAGE_FORMAT, ABS_OPERATION,
+                       CALLBACKFUNC, bsapi_callback)
+
+GRABFUNC = CFUNCTYPE(c_int, c_int, POINTER(ABS_OPERATION), c_uint,
+                     POINTER(ABS_IMAGE_FORMAT), POINTER(POINTER(ABS_IMAGE)),
+                     c_void_p, c_void_p, c_uint)
+
+def _fake_grab(conn, operation, purpose, image_format, image, swipe,
+               reserved, flags):
+    return ABS_STATUS_TIMEOUT
+
+# keep the stand-in alive for the whole run
+_fake_grab_thunk = GRABFUNC(_fake_grab)
+
+def untyped_grab():
+    # what CDLL hands out: a function pointer without argtypes/restype
+    grab = CFUNCTYPE(c_int)(cast(_fake_grab_thunk, c_void_p).value)
+    grab.argtypes = None
+    return grab
+
+def typed_grab():
+    return _fake_grab_thunk
+
+def legacy_pulse(grab, conn_handle, image_format, timeout):
+    operation_parameters = ABS_OPERATION(
+        0, None, CALLBACKFUNC(bsapi_callback), timeout, 0x1)
+    image = POINTER(ABS_IMAGE)()
+    grab(conn_handle, byref(operation_parameters), 0,
+         byref(image_format), byref(image), None, None, 0)
+
+def prepared_pulse_factory(grab, conn_handle, image_format, timeout):
+    callback = CALLBACKFUNC(bsapi_callback)
+    operation = ABS_OPERATION(0, None, callback, timeout, 0x1)
+    image = POINTER(ABS_IMAGE)()
+    args = (conn_handle, byref(operation), 0, byref(image_format),
+            byref(image), None, None, 0)
+    def pulse():
+        return grab(*args)
+    # hold references to everything the argument tuple points at
+    pulse.keepalive = (callback, operation, image)
+    return pulse
+
+def time_calls(func, pulses):
+    samples = np.empty(pulses, dtype=np.int64)
+    for i in range(pulses):
+        t1 = time.perf_counter_ns()
+        func()
+        samples[i] = time.perf_counter_ns() - t1
+    return samples
+
+def summarize(name, samples):
+    us = samples / 1000.0
+    print("{:<10} mean {:8.2f} us  p50 {:8.2f} us  p99 {:8.2f} us  "
+          "max {:8.2f} us".format(name, us.mean(), np.percentile(us, 50),
+                                  np.percentile(us, 99), us.max()))
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the host overhead of one FMDevice pulse before and after preparing the ABSGrabImage call once per session.')
+    parser.add_argument('-p', '--pulses', type=int, default=100000, help='number of pulses to time (default=100000)')
+    parser.add_argument('-t', '--timeout', type=int, default=50, help='timeout stored in the operation (default=50)')
+    args = parser.parse_args()
+
+    conn_handle = c_int(1)
+    image_format = ABS_IMAGE_FORMAT()
+
+    legacy_grab = untyped_grab()
+    legacy = lambda: legacy_pulse(legacy_grab, conn_handle, image_format,
+                                  args.timeout)
+    prepared = prepared_pulse_factory(typed_grab(), conn_handle,
+                                      image_format, args.timeout)
+
+    # warm up both paths before timing
+    time_calls(legacy, 1000)
+    time_calls(prepared, 1000)
+
+    before = time_calls(legacy, args.pulses)
+    after = time_calls(prepared, args.pulses)
+    summarize("before", before)
+    summarize("after", after)
+    print("saved {:.2f} us per pulse".format(
+        (before.mean() - after.mean()) / 1000.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+'''
+Benchmark of the receive chain on synthetic data.
+A deterministic capture (channel_sim.py: OOK frames with noise and a
+carrier offset, fixed seed) is generated at the requested length, and every
+stage from raw uint8 bytes to detected preambles is timed on it: best of
+--repeats runs for throughput in MS/s, and one more run under tracemalloc
+for its peak memory. legacy_read_file is the old sdr_read_file, kept as a
+reference point. Results are printed against SAMPLE_RATE and written to a
+JSON file; --compare takes an earlier JSON and fails (exit 1) when a stage
+got slower by more than --tolerance.
+'''
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import channel_sim
+from capture_reader import CHUNK, CaptureReader
+from channel_filter import ChannelFilter, decimate
+from demod import demodulate
+from fast_plot import MinMaxAccumulator
+from frame_encoder import FrameEncoder
+from iq_samples import bytes_to_envelope, bytes_to_iq
+from line_codes import OOK
+from preamble_sync import find_preambles, preamble_template
+from radio_config import SAMPLE_RATE
+from spectrogram import Spectrogram
+
+OUTPUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "bench_receive.json")
+
+# synthetic signal: OOK frames of SYMBOL_MS symbols and BURST_MS bursts,
+# CARRIER_OFFSET Hz off center
+SYMBOL_MS = 60
+BURST_MS = 40
+CARRIER_OFFSET = 30e3
+SEED = 1
+
+def synthetic_capture(seconds, sample_rate=SAMPLE_RATE, seed=SEED):
+    '''
+    uint8 interleaved I/Q of at least seconds of repeated frames
+    '''
+    encoder = FrameEncoder(line_code=OOK(SYMBOL_MS))
+    frame = encoder.schedule(b'\xa5\x3c')
+    frame_ms = frame.duration_ns / 1e6 + 333
+    schedule = channel_sim.repeat_schedule(
+        frame, max(int(np.ceil(seconds * 1000 / frame_ms)), 1), 333)
+    rng = np.random.default_rng(seed)
+    bursts = channel_sim.burst_lengths(len(schedule.offsets_ns),
+                                       burst_ms=BURST_MS, rng=rng)
+    chunks = channel_sim.iq_chunks(schedule, bursts, sample_rate,
+                                   noise=0.2, carrier_offset=CARRIER_OFFSET,
+                                   seed=seed)
+    raw = np.concatenate([chunk.copy() for chunk in chunks])
+    return raw[:2 * int(seconds * sample_rate)]
+
+def legacy_read_file(address):
+    # sdr_read_file before capture_reader: float64 temporaries and a
+    # complex128 result
+    f = open(address, 'r')
+    data = np.fromfile(f, dtype=np.uint8)
+    iq_output = (data[0::2]/(255.0/2.0)-1) + (1j*(data[1::2]/(255.0/2.0)-1))
+    f.close()
+    return iq_output
+
+def read_file(address):
+    with CaptureReader(address) as capture:
+        return capture.read(out=np.empty(len(capture), dtype=np.complex64))
+
+def stream_file(address):
+    with CaptureReader(address) as capture:
+        for chunk in capture:
+            pass
+
+def magnitude(iq):
+    # as sdr_read_write.read(), into one reused buffer
+    return np.absolute(iq, out=np.empty(len(iq), dtype=np.float32))
+
+def minmax(envelope):
+    accumulator = MinMaxAccumulator()
+    accumulator.add(envelope)
+    return accumulator.envelope()
+
+def blocks(iq):
+    # streaming stages get blocks the size CaptureReader hands out
+    return (iq[i:i + CHUNK] for i in range(0, len(iq), CHUNK))
+
+def channel_filter(iq):
+    stage = ChannelFilter(offset_hz=CARRIER_OFFSET)
+    for block in blocks(iq):
+        stage.process(block)
+    return stage.flush()
+
+def spectrogram(iq):
+    stage = Spectrogram()
+    for block in blocks(iq):
+        stage.process(block)
+
+def preambles(decimated, sample_rate):
+    template = preamble_template(sample_rate, SYMBOL_MS, BURST_MS)
+    return find_preambles(np.abs(decimated), template)
+
+def chain(address):
+    '''
+    file -> complex64 -> channel filter -> envelope -> preambles, streamed
+    '''
+    channel_filter = ChannelFilter(offset_hz=CARRIER_OFFSET)
+    parts = []
+    with CaptureReader(address) as capture:
+        for chunk in capture:
+            parts.append(channel_filter.process(chunk))
+    parts.append(channel_filter.flush())
+    return preambles(np.concatenate(parts), channel_filter.output_rate)
+
+def measure(func, repeats):
+    best = float("inf")
+    for i in range(repeats):
+        t1 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t1)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+def stages(path, raw, sample_rate):
+    '''
+    (name, function) of every stage, in chain order; each reads what the
+    stage before it produces, computed once up front
+    '''
+    iq = bytes_to_iq(raw)
+    envelope = np.abs(iq)
+    decimated = decimate(iq, offset_hz=CARRIER_OFFSET)
+    rate = sample_rate / ChannelFilter().decimation
+    return [
+        ("legacy_read_file", lambda: legacy_read_file(path)),
+        ("sdr_read_file", lambda: read_file(path)),
+        ("capture_chunks", lambda: stream_file(path)),
+        ("bytes_to_iq", lambda: bytes_to_iq(raw)),
+        ("magnitude", lambda: magnitude(iq)),
+        ("bytes_to_envelope", lambda: bytes_to_envelope(raw)),
+        ("minmax_plot", lambda: minmax(envelope)),
+        ("channel_filter", lambda: channel_filter(iq)),
+        ("demodulate_full_rate", lambda: demodulate(iq, SYMBOL_MS,
+                                                    sample_rate)),
+        ("preamble_sync", lambda: preambles(decimated, rate)),
+        ("spectrogram", lambda: spectrogram(iq)),
+        ("chain", lambda: chain(path)),
+    ]
+
+def run(seconds, repeats, sample_rate=SAMPLE_RATE):
+    raw = synthetic_capture(seconds, sample_rate)
+    num_samples = len(raw) // 2
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "synthetic.bin")
+        raw.tofile(path)
+        for name, func in stages(path, raw, sample_rate):
+            seconds_taken, peak = measure(func, repeats)
+            rate = num_samples / seconds_taken / 1e6
+            results.append({"stage": name,
+                            "seconds": seconds_taken,
+                            "msps": rate,
+                            "realtime": rate * 1e6 / sample_rate,
+                            "peak_mb": peak / 1e6})
+    return {"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "samples": num_samples,
+            "sample_rate": sample_rate,
+            "capture_mb": len(raw) / 1e6,
+            "stages": results}
+
+def compare(report, baseline, tolerance):
+    '''
+    stages at least tolerance (fraction) slower than in baseline
+    '''
+    before = {s["stage"]: s["msps"] for s in baseline["stages"]}
+    return [(s["stage"], before[s["stage"]], s["msps"])
+            for s in report["stages"]
+            if s["stage"] in before
+            and s["msps"] < before[s["stage"]] * (1 - tolerance)]
+
+def main():
+    parser = argparse.ArgumentParser(description='Time every receive stage on deterministic synthetic IQ and write the results as JSON.')
+    parser.add_argument('-s', '--seconds', type=float, default=10, help='length of the synthetic capture in seconds at the sample rate (default=10)')
+    parser.add_argument('-r', '--rate', type=float, default=SAMPLE_RATE, help='sample rate of the synthetic capture (default=%(default)s)')
+    parser.add_argument('-n', '--repeats', type=int, default=3, help='timed runs per stage, the best one counts (default=3)')
+    parser.add_argument('-o', '--output', default=OUTPUT_PATH, help='JSON results file (default=%(default)s)')
+    parser.add_argument('--compare', default=None, help='earlier results file to check against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='slowdown counted as a regression (default=0.2)')
+    args = parser.parse_args()
+
+    report = run(args.seconds, args.repeats, args.rate)
+    print("{} samples ({:.1f} MB) at {:.3f} MS/s".format(
+        report["samples"], report["capture_mb"], args.rate / 1e6))
+    for s in report["stages"]:
+        print("{:<22} {:9.1f} MS/s  {:7.1f}x realtime  peak {:8.1f} MB".format(
+            s["stage"], s["msps"], s["realtime"], s["peak_mb"]))
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["samples"] != report["samples"]:
+            print("note: {} has {} samples, this run {}".format(
+                args.compare, baseline["samples"], report["samples"]))
+        regressions = compare(report, baseline, args.tolerance)
+        for stage, before, after in regressions:
+            print("REGRESSION {}: {:.1f} -> {:.1f} MS/s".format(
+                stage, before, after))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
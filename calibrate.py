@@ -0,0 +1,57 @@
+'''
+Sweeps ABSGrabImage timeouts on the attached sensor and measures how long
+each burst really lasts, many times per timeout. The p50/p99 distribution
+for every timeout is written to the timing profile that modulator.py
+loads at startup (see timing_profile.py).
+Durations are measured on the host around the BSAPI call.
+'''
+
+import argparse
+import time
+
+import numpy as np
+from fprint_codes import ABS_STATUS_OK, ABS_STATUS_TIMEOUT, check_call
+from modulator import FMDevice, PULSE_TIMEOUT, delay
+from timing_profile import PROFILE_PATH, save_profile, summarize
+
+# the timeouts of the hand measured delay table, plus the one the
+# modulator keys with
+DEFAULT_TIMEOUTS = sorted({1, 100, 250, 460, 500, 1000, PULSE_TIMEOUT})
+
+def measure(fm, timeout, repetitions, gap_ms=0):
+    fm.set_timeout(timeout)
+    durations = np.empty(repetitions, dtype=np.int64)
+    for i in range(repetitions):
+        start = time.monotonic_ns()
+        status = fm.pulse()
+        durations[i] = time.monotonic_ns() - start
+        if status not in (ABS_STATUS_OK, ABS_STATUS_TIMEOUT):
+            check_call(status)
+        if gap_ms:
+            time.sleep(gap_ms / 1000.0)
+    return durations
+
+def main():
+  parser = argparse.ArgumentParser(description='Measure the burst length of the fingerprint sensor for a range of timeouts and save it as a timing profile.'+delay)
+  parser.add_argument('-t', '--timeouts', type=int, nargs='+', default=DEFAULT_TIMEOUTS, help='timeouts to sweep (default: the delay table and PULSE_TIMEOUT)')
+  parser.add_argument('-r', '--repetitions', type=int, default=200, help='pulses per timeout (default=200)')
+  parser.add_argument('-g', '--gap', type=int, default=0, help='pause between pulses in ms (default=0)')
+  parser.add_argument('-o', '--output', default=PROFILE_PATH, help='profile file (default=%(default)s)')
+  args = parser.parse_args()
+
+  fm = FMDevice(args.timeouts[0])
+  timeouts = {}
+  print("timeout |   p50 ms |   p99 ms |   max ms")
+  for t in args.timeouts:
+    stats = summarize(measure(fm, t, args.repetitions, args.gap))
+    timeouts[t] = stats
+    print("{:7d} | {:8.1f} | {:8.1f} | {:8.1f}".format(
+        t, stats["p50_ms"], stats["p99_ms"], stats["max_ms"]))
+
+  save_profile(timeouts, args.output)
+  print("Saved", args.output)
+  del fm
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,107 @@
+'''
+Chunked reader for raw RTL-SDR captures (interleaved uint8 I/Q, as written
+by rtl_sdr or sdr_read_write) of any size.
+The file is memory mapped rather than read, and every chunk goes through
+the IQ_LUT table of iq_samples straight into one reusable complex64 buffer,
+so memory stays at one chunk (plus whatever pages the OS keeps cached)
+whether the capture is a megabyte or many gigabytes. Positions are in
+samples (one I/Q pair); seek_ms() converts from time at sample_rate.
+'''
+
+import os
+
+import numpy as np
+from iq_samples import bytes_to_iq
+from radio_config import SAMPLE_RATE
+
+# samples per chunk: 8 MB of complex64
+CHUNK = 1 << 20
+
+class CaptureReader:
+    """
+    Memory-mapped capture. read() and chunks() return views of a buffer
+    that the next call overwrites; copy what has to be kept.
+
+    """
+    def __init__(self, path, sample_rate=SAMPLE_RATE, chunk=CHUNK):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.chunk = chunk
+        # np.memmap refuses empty files
+        if os.path.getsize(path) >= 2:
+            self.raw = np.memmap(path, dtype=np.uint8, mode="r")
+        else:
+            self.raw = np.zeros(0, dtype=np.uint8)
+        self.num_samples = len(self.raw) // 2
+        self.position = 0
+        self.__buffer = np.empty(chunk, dtype=np.complex64)
+
+    def __len__(self):
+        return self.num_samples
+
+    @property
+    def duration_ms(self):
+        return self.num_samples / self.sample_rate * 1000
+
+    def sample_at(self, ms):
+        return int(round(ms * self.sample_rate / 1000))
+
+    def seek(self, sample):
+        '''
+        moves to sample (negative counts from the end); returns the new
+        position
+        '''
+        if sample < 0:
+            sample += self.num_samples
+        self.position = min(max(int(sample), 0), self.num_samples)
+        return self.position
+
+    def seek_ms(self, ms):
+        return self.seek(self.sample_at(ms))
+
+    def tell(self):
+        return self.position
+
+    def read(self, num_samples=None, out=None):
+        '''
+        up to num_samples (default one chunk) from the current position,
+        converted into out or the reader's own buffer
+        '''
+        if num_samples is None:
+            num_samples = self.chunk if out is None else len(out)
+        num_samples = min(num_samples, self.num_samples - self.position)
+        if out is None:
+            if num_samples > len(self.__buffer):
+                self.__buffer = np.empty(num_samples, dtype=np.complex64)
+            out = self.__buffer
+        start = 2 * self.position
+        samples = bytes_to_iq(self.raw[start:start + 2 * num_samples], out)
+        self.position += num_samples
+        return samples
+
+    def chunks(self, start=None, stop=None, chunk=None, out=None):
+        '''
+        yields consecutive chunks from start (default: the current
+        position) up to stop samples, all in the same buffer
+        '''
+        if start is not None:
+            self.seek(start)
+        stop = self.num_samples if stop is None else min(stop,
+                                                         self.num_samples)
+        chunk = chunk or (len(out) if out is not None else self.chunk)
+        while self.position < stop:
+            yield self.read(min(chunk, stop - self.position), out)
+
+    def __iter__(self):
+        return self.chunks(0)
+
+    def close(self):
+        # dropping the memmap unmaps the file
+        self.raw = np.zeros(0, dtype=np.uint8)
+        self.num_samples = self.position = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
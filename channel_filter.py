@@ -0,0 +1,139 @@
+'''
+Channel filter: frequency shift, low-pass and decimate a stream of IQ
+samples in one stage.
+The sensor bursts are tens of milliseconds long, so after moving the
+signal to 0 Hz (offset_hz is where it sits relative to the tuned center
+frequency) a few kHz of bandwidth keeps all of it, and everything after
+this stage (demod.py, preamble_sync.py, plots) can work at
+SAMPLE_RATE / decimation instead of SAMPLE_RATE.
+The low-pass is a windowed-sinc FIR run in polyphase form: its taps are
+split into decimation phases and only the kept outputs are computed, as a
+few matrix-vector products over the block reshaped to rows of decimation
+samples. The oscillator phase and the samples the next outputs need are
+carried from block to block, so feeding a capture in any block sizes
+gives the same output as feeding it whole.
+'''
+
+import numpy as np
+from radio_config import SAMPLE_RATE
+
+# 1.024 MS/s -> 10.24 kS/s
+DECIMATION = 100
+
+# filter length in output samples (taps = TAPS_PER_PHASE * decimation)
+TAPS_PER_PHASE = 8
+
+# passband edge as a fraction of the output Nyquist frequency
+CUTOFF = 0.8
+
+def lowpass_taps(num_taps, cutoff):
+    '''
+    Blackman windowed-sinc low-pass with unity gain at 0 Hz; cutoff in
+    cycles per sample (0..0.5)
+    '''
+    n = np.arange(num_taps) - (num_taps - 1) / 2.0
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.blackman(num_taps)
+    return (taps / taps.sum()).astype(np.float32)
+
+class ChannelFilter:
+    """
+    Streaming mixer + decimating low-pass. process() takes complex blocks
+    of any size and returns the complex64 output samples they complete;
+    flush() returns the rest at the end of a stream. Output sample m is
+    centered on input sample m * decimation, so positions found in the
+    output map straight back to the input.
+
+    """
+    def __init__(self, decimation=DECIMATION, sample_rate=SAMPLE_RATE,
+                 offset_hz=0.0, taps=None, cutoff=CUTOFF):
+        self.decimation = D = int(decimation)
+        self.sample_rate = sample_rate
+        self.output_rate = sample_rate / D
+        self.offset_hz = offset_hz
+        if taps is None:
+            taps = lowpass_taps(TAPS_PER_PHASE * D, cutoff * 0.5 / D)
+        taps = np.asarray(taps, dtype=np.float32)
+        # pad to whole phases; a window of taps ends each output
+        self.phases = -(-len(taps) // D)
+        padded = np.zeros(self.phases * D, dtype=np.float32)
+        padded[:len(taps)] = taps[::-1]
+        self.taps = taps
+        self.__polyphase = padded.reshape(self.phases, D)
+        self.__step = -2 * np.pi * offset_hz / sample_rate
+        self.__oscillator = np.zeros(0, dtype=np.complex64)
+        self.reset()
+
+    def reset(self):
+        self.__phase = 0.0
+        self.__inputs = 0
+        self.__outputs = 0
+        # half a filter of zeros in front centers the outputs
+        self.__pending = np.zeros(len(self.taps) // 2, dtype=np.complex64)
+
+    def mix(self, iq):
+        '''
+        iq shifted down by offset_hz, continuing the oscillator phase
+        '''
+        if not self.offset_hz:
+            return np.asarray(iq, dtype=np.complex64)
+        n = len(iq)
+        if n > len(self.__oscillator):
+            # one table of exp(j * step * k), rotated to the current phase
+            self.__oscillator = np.exp(1j * self.__step * np.arange(n)
+                                       ).astype(np.complex64)
+        out = np.multiply(iq, self.__oscillator[:n], dtype=np.complex64)
+        out *= np.complex64(np.exp(1j * self.__phase))
+        self.__phase = (self.__phase + self.__step * n) % (2 * np.pi)
+        return out
+
+    def __filter(self, x):
+        D, Q = self.decimation, self.phases
+        data = np.concatenate((self.__pending, x))
+        rows = len(data) // D
+        count = rows - Q + 1
+        if count <= 0:
+            self.__pending = data
+            return np.zeros(0, dtype=np.complex64)
+        blocks = data[:rows * D].reshape(rows, D)
+        out = blocks[:count] @ self.__polyphase[0]
+        for q in range(1, Q):
+            out += blocks[q:q + count] @ self.__polyphase[q]
+        self.__pending = data[count * D:]
+        self.__outputs += count
+        return out
+
+    def process(self, iq):
+        self.__inputs += len(iq)
+        return self.__filter(self.mix(iq))
+
+    def flush(self):
+        '''
+        outputs for the last input samples, with zeros after them
+        '''
+        wanted = -(-self.__inputs // self.decimation) - self.__outputs
+        if wanted <= 0:
+            return np.zeros(0, dtype=np.complex64)
+        out = self.__filter(np.zeros(len(self.taps), dtype=np.complex64))
+        return out[:wanted]
+
+def filter_blocks(blocks, channel_filter):
+    '''
+    runs channel_filter over an iterable of IQ blocks (SdrReceiver.blocks(),
+    CaptureReader.chunks(), ...) and yields the decimated blocks
+    '''
+    for block in blocks:
+        out = channel_filter.process(block)
+        if len(out):
+            yield out
+    out = channel_filter.flush()
+    if len(out):
+        yield out
+
+def decimate(iq, decimation=DECIMATION, sample_rate=SAMPLE_RATE,
+             offset_hz=0.0):
+    '''
+    one-shot version for a capture that fits in memory
+    '''
+    channel_filter = ChannelFilter(decimation, sample_rate, offset_hz)
+    return np.concatenate((channel_filter.process(iq),
+                           channel_filter.flush()))
@@ -0,0 +1,162 @@
+'''
+Synthetic channel: turns the pulses the modulator would key into an
+RTL-SDR capture, without a sensor or a dongle.
+Every pulse becomes a burst of a carrier at carrier_offset Hz from the
+tuner frequency, with burst lengths drawn from the timing profile (see
+timing_profile.py), plus complex gaussian noise. The output is interleaved
+uint8 I/Q, the same format rtl_sdr writes and sdr.sdr_read_file reads,
+generated and written in fixed-size chunks so captures of any length fit
+in a few MB of memory.
+'''
+
+import argparse
+
+import numpy as np
+from frame_encoder import BARKER_13, FrameEncoder, as_bits
+from line_codes import LINE_CODES, PPM, Schedule
+from radio_config import SAMPLE_RATE
+from timing_profile import load_profile, pulse_stats
+
+# samples generated per chunk
+CHUNK = 1 << 18
+
+# burst length when there is no profile; the fastest entry of the delay
+# table in modulator.py
+BURST_MS = 40
+
+def repeat_schedule(schedule, repeats, gap_ms):
+    '''
+    the same frame repeats times with gap_ms of silence in between, like
+    modulator.main()
+    '''
+    frame_ns = schedule.duration_ns + int(gap_ms * 1000000)
+    starts = np.arange(repeats, dtype=np.int64) * frame_ns
+    offsets = (starts[:, None] + np.asarray(schedule.offsets_ns)).ravel()
+    return Schedule(offsets, frame_ns * repeats)
+
+def burst_lengths(count, profile=None, timeout=None, burst_ms=BURST_MS,
+                  rng=None):
+    '''
+    burst lengths in ns: normal around the profile's p50 for timeout with
+    its p99 at 2.33 sigma, or burst_ms for every burst without a profile
+    '''
+    stats = pulse_stats(profile, timeout)
+    if stats is None:
+        return np.full(count, int(burst_ms * 1000000), dtype=np.int64)
+    rng = rng or np.random.default_rng()
+    sigma = max(stats["p99_ms"] - stats["p50_ms"], 0) / 2.33
+    ms = rng.normal(stats["p50_ms"], sigma, count)
+    ms = np.clip(ms, stats["min_ms"], stats["max_ms"])
+    return (ms * 1000000).astype(np.int64)
+
+def iq_chunks(schedule, burst_ns, sample_rate=SAMPLE_RATE, amplitude=0.5,
+              noise=0.05, carrier_offset=0.0, lead_ms=100, tail_ms=100,
+              chunk=CHUNK, seed=0):
+    '''
+    yields the capture as interleaved uint8 I/Q arrays of 2 * chunk bytes
+    (the last one shorter). noise is the standard deviation of I and Q in
+    the same -1..1 scale as amplitude.
+    '''
+    rng = np.random.default_rng(seed)
+    to_samples = sample_rate / 1e9
+    lead = int(lead_ms * sample_rate / 1000)
+    starts = lead + np.rint(np.asarray(schedule.offsets_ns) * to_samples
+                            ).astype(np.int64)
+    ends = starts + np.maximum(np.rint(burst_ns * to_samples), 1
+                               ).astype(np.int64)
+    # bursts longer than their spacing overlap, so search on the furthest
+    # end reached so far
+    reach = np.maximum.accumulate(ends) if len(ends) else ends
+    total = (lead + int(round(schedule.duration_ns * to_samples))
+             + int(tail_ms * sample_rate / 1000))
+
+    step = 2 * np.pi * carrier_offset / sample_rate
+    ramp = np.arange(chunk, dtype=np.float64) * step
+    edges = np.zeros(chunk + 1, dtype=np.int32)
+    iq = np.empty(2 * chunk, dtype=np.float32)
+    out = np.empty(2 * chunk, dtype=np.uint8)
+
+    for a in range(0, total, chunk):
+        n = min(chunk, total - a)
+        b = a + n
+        # bursts overlapping [a, b) as +1/-1 edges, integrated into the
+        # on/off envelope
+        first = np.searchsorted(reach, a, side="right")
+        last = np.searchsorted(starts, b, side="left")
+        edges[:n + 1] = 0
+        np.add.at(edges, np.clip(starts[first:last] - a, 0, n), 1)
+        np.add.at(edges, np.clip(ends[first:last] - a, 0, n), -1)
+        envelope = np.cumsum(edges[:n]) * np.float32(amplitude)
+
+        phase = ramp[:n] + (step * a) % (2 * np.pi)
+        i = iq[0:2 * n:2]
+        q = iq[1:2 * n:2]
+        i[:] = rng.standard_normal(n, dtype=np.float32)
+        q[:] = rng.standard_normal(n, dtype=np.float32)
+        i *= noise
+        q *= noise
+        i += envelope * np.cos(phase)
+        q += envelope * np.sin(phase)
+
+        # inverse of sdr_read_file: x = byte / 127.5 - 1
+        scaled = iq[:2 * n]
+        scaled *= 127.5
+        scaled += 127.5
+        np.clip(scaled, 0, 255, out=scaled)
+        np.rint(scaled, out=scaled)
+        out[:2 * n] = scaled
+        yield out[:2 * n]
+
+def write_iq(path, chunks):
+    written = 0
+    with open(path, "wb") as f:
+        for block in chunks:
+            block.tofile(f)
+            written += block.size
+    return written
+
+def main():
+  parser = argparse.ArgumentParser(description='Write a synthetic RTL-SDR capture (interleaved uint8 I/Q) of the frames the modulator would send.')
+  parser.add_argument('output', help='capture file to write')
+  parser.add_argument('--payload', default='aa', help='payload bytes in hex (default=aa, the byte modulator.py sends)')
+  parser.add_argument('--bits', help='key this bit string as is instead of a preamble + payload frame')
+  parser.add_argument('--line-code', choices=sorted(LINE_CODES), default='ook', help='line code (default=ook)')
+  parser.add_argument('--symbol-ms', type=float, default=177, help='symbol period, or slot width for ppm (default=177)')
+  parser.add_argument('--guard-ms', type=float, default=40, help='ppm guard time (default=40)')
+  parser.add_argument('--fec-depth', type=int, default=None, help='interleaver depth to enable FEC')
+  parser.add_argument('--repeats', type=int, default=1, help='number of frames (default=1)')
+  parser.add_argument('--gap-ms', type=float, default=250, help='silence between frames (default=250)')
+  parser.add_argument('--profile', default=None, help='timing profile for burst lengths (default: the saved profile, if any)')
+  parser.add_argument('--timeout', type=int, default=50, help='pulse timeout to look up in the profile (default=50)')
+  parser.add_argument('--burst-ms', type=float, default=BURST_MS, help='burst length without a profile (default=%(default)s)')
+  parser.add_argument('--rate', type=float, default=SAMPLE_RATE, help='sample rate (default=%(default)s)')
+  parser.add_argument('--offset', type=float, default=50e3, help='carrier offset from the tuner in Hz (default=50e3)')
+  parser.add_argument('--amplitude', type=float, default=0.5, help='burst amplitude, 0..1 (default=0.5)')
+  parser.add_argument('--noise', type=float, default=0.05, help='noise standard deviation (default=0.05)')
+  parser.add_argument('--seed', type=int, default=0, help='random seed (default=0)')
+  args = parser.parse_args()
+
+  if args.line_code == 'ppm':
+    line_code = PPM(args.symbol_ms, args.guard_ms)
+  else:
+    line_code = LINE_CODES[args.line_code](args.symbol_ms)
+  if args.bits:
+    schedule = line_code.schedule(as_bits(args.bits))
+  else:
+    encoder = FrameEncoder(BARKER_13, line_code, args.fec_depth)
+    schedule = encoder.schedule(bytes.fromhex(args.payload))
+  schedule = repeat_schedule(schedule, args.repeats, args.gap_ms)
+
+  profile = load_profile(args.profile) if args.profile else load_profile()
+  rng = np.random.default_rng(args.seed)
+  bursts = burst_lengths(len(schedule.offsets_ns), profile, args.timeout,
+                         args.burst_ms, rng)
+  written = write_iq(args.output, iq_chunks(
+      schedule, bursts, args.rate, args.amplitude, args.noise, args.offset,
+      seed=args.seed))
+  print("Wrote {} samples ({:.1f} s) to {}".format(
+      written // 2, written / 2 / args.rate, args.output))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,158 @@
+'''
+OOK demodulator: IQ samples back to the bits modulator.py keyed.
+envelope (|iq|) -> moving average -> per-symbol peak -> threshold.
+A "1" symbol holds a burst somewhere in its slot and a "0" only noise, so
+each symbol is decided on the peak of the smoothed envelope inside its
+window, compared to a threshold halfway between the noise floor and the
+burst level. Everything is whole-array NumPy; OokDemodulator carries
+the state needed to run it block by block on a live stream.
+'''
+
+from collections import namedtuple
+
+import numpy as np
+from radio_config import SAMPLE_RATE
+
+# moving average length; well under the shortest burst (40 ms)
+SMOOTH_MS = 2.0
+
+# envelope percentiles taken as the noise floor and the burst level; the
+# smoothed envelope changes slowly, so every LEVEL_STRIDE-th sample will do
+FLOOR_PERCENTILE = 10
+PEAK_PERCENTILE = 99.9
+LEVEL_STRIDE = 16
+
+# a block's peak is only taken as the burst level when it stands at least
+# this many noise spreads (floor minus the NOISE_PERCENTILE of the smoothed
+# envelope, all noise even in busy blocks) above the floor; the threshold
+# never drops below half of that gap, so idle stretches decode as zeros
+# instead of pulling the level into the noise
+BURST_SPREADS = 12
+NOISE_PERCENTILE = 1
+
+Symbols = namedtuple("Symbols", ["bits", "confidence", "levels"])
+
+def envelope(iq, out=None):
+    '''
+    |iq| as float32 (float64 input stays float64)
+    '''
+    return np.absolute(iq, out=out)
+
+def moving_average(padded, width, skip=0):
+    '''
+    average of the width samples ending at each sample of padded[skip:];
+    where fewer than width samples precede it, the ones there are
+    '''
+    sums = np.empty(len(padded) + 1, dtype=np.float64)
+    sums[0] = 0
+    np.cumsum(padded, out=sums[1:])
+    out = np.empty(len(padded), dtype=np.float32)
+    head = min(width - 1, len(padded))
+    out[:head] = sums[1:head + 1] / np.arange(1, head + 1)
+    np.subtract(sums[width:], sums[:-width], out=sums[width:])
+    out[head:] = sums[width:] / width
+    return out[skip:]
+
+def smooth(x, width, history=None):
+    '''
+    moving average of width samples; history (the width - 1 samples
+    before x) makes consecutive blocks join up
+    '''
+    if history is None or not len(history):
+        return moving_average(x, width)
+    return moving_average(np.concatenate((history, x)), width, len(history))
+
+def levels(smoothed):
+    '''
+    (noise floor, burst level) of a smoothed envelope
+    '''
+    low, high = np.percentile(smoothed[::LEVEL_STRIDE],
+                              [FLOOR_PERCENTILE, PEAK_PERCENTILE])
+    return float(low), float(high)
+
+def slice_symbols(smoothed, samples_per_symbol, threshold, span):
+    '''
+    decides every whole symbol in smoothed; span is (burst level - noise
+    floor), used to scale the confidence to 0..1
+    '''
+    sps = int(samples_per_symbol)
+    count = len(smoothed) // sps
+    peaks = smoothed[:count * sps].reshape(count, sps).max(axis=1)
+    bits = (peaks > threshold).astype(np.uint8)
+    confidence = np.clip(np.abs(peaks - threshold) / (0.5 * span + 1e-12),
+                         0, 1).astype(np.float32)
+    return Symbols(bits, confidence, peaks)
+
+def demodulate(iq, symbol_period_ms, sample_rate=SAMPLE_RATE, offset=0,
+               smooth_ms=SMOOTH_MS):
+    '''
+    one-shot demodulation of a whole capture; offset is the sample the
+    first symbol starts at (see preamble_sync.py)
+    '''
+    smoothed = smooth(envelope(np.asarray(iq)[offset:]),
+                      max(int(smooth_ms * sample_rate / 1000), 1))
+    low, high = levels(smoothed)
+    return slice_symbols(smoothed, symbol_period_ms * sample_rate / 1000,
+                         0.5 * (low + high), high - low)
+
+class OokDemodulator:
+    """
+    Streaming version of demodulate(). process() takes IQ blocks of any
+    size and returns the symbols completed by them. The noise floor and
+    burst level follow the signal with an exponential average over blocks
+    (level_alpha), unless a fixed threshold is given; the burst level only
+    moves on blocks that hold a burst (see BURST_SPREADS).
+
+    """
+    def __init__(self, symbol_period_ms, sample_rate=SAMPLE_RATE, offset=0,
+                 smooth_ms=SMOOTH_MS, threshold=None, level_alpha=0.2):
+        self.samples_per_symbol = int(round(symbol_period_ms * sample_rate
+                                            / 1000))
+        self.width = max(int(smooth_ms * sample_rate / 1000), 1)
+        self.threshold = threshold
+        self.level_alpha = level_alpha
+        self.low = self.high = self.spread = None
+        self.__skip = offset
+        self.__history = np.zeros(0, dtype=np.float32)
+        self.__pending = np.zeros(0, dtype=np.float32)
+
+    def process(self, iq):
+        env = envelope(np.asarray(iq))
+        if self.__skip:
+            skipped = min(self.__skip, len(env))
+            env = env[skipped:]
+            self.__skip -= skipped
+        if not len(env):
+            return Symbols(np.zeros(0, np.uint8), np.zeros(0, np.float32),
+                           np.zeros(0, np.float32))
+
+        padded = np.concatenate((self.__history, env))
+        smoothed = moving_average(padded, self.width, len(self.__history))
+        self.__history = padded[max(len(padded) - (self.width - 1), 0):]
+
+        low, high = levels(smoothed)
+        spread = low - float(np.percentile(smoothed[::LEVEL_STRIDE],
+                                           NOISE_PERCENTILE))
+        a = self.level_alpha
+        if self.low is None:
+            self.low, self.spread = low, spread
+        else:
+            self.low += a * (low - self.low)
+            self.spread += a * (spread - self.spread)
+        gap = BURST_SPREADS * self.spread
+        if high > self.low + gap:
+            if self.high is None:
+                self.high = high
+            else:
+                self.high += a * (high - self.high)
+        # no burst seen yet: nothing but a clear burst decodes as a 1
+        top = max(self.high if self.high is not None else 0.0,
+                  self.low + gap)
+        threshold = (self.threshold if self.threshold is not None
+                     else 0.5 * (self.low + top))
+
+        data = np.concatenate((self.__pending, smoothed))
+        sps = self.samples_per_symbol
+        whole = len(data) // sps * sps
+        self.__pending = data[whole:]
+        return slice_symbols(data[:whole], sps, threshold, top - self.low)
@@ -0,0 +1,213 @@
+'''
+Amplitude plots that stay fast however many samples there are.
+A screen can't show more than one value range per pixel column, so the
+samples are reduced to the min and max of each column's bin before
+matplotlib sees them: a whole capture becomes a few thousand points in
+one Line2D. MinMaxAccumulator does the reduction block by block and
+halves its resolution when it fills up, so its memory is fixed whatever
+the length. LivePlot scrolls the last span_ms of a stream in one artist
+and redraws only that artist (blitting) on every update.
+'''
+
+import matplotlib.pyplot as plt
+import numpy as np
+from capture_reader import CaptureReader
+from iq_samples import bytes_to_envelope
+
+# horizontal resolution the envelopes are reduced to
+PIXELS = 2000
+
+# samples per block when reducing a capture file
+CHUNK = 1 << 18
+
+# |iq| of uint8 samples never exceeds sqrt(2); a fixed y range means the
+# axes never have to be redrawn
+AMPLITUDE_RANGE = (0, 1.5)
+
+def interleave(low, high):
+    '''
+    one line through the min and max of every bin, in that order
+    '''
+    y = np.empty(2 * len(low), dtype=np.float32)
+    y[0::2] = low
+    y[1::2] = high
+    return y
+
+class MinMaxAccumulator:
+    """
+    Min and max of consecutive bins of bin_size samples, fed with add().
+    When more than 2 * pixels bins have been collected, neighbours are
+    merged and bin_size doubles.
+
+    """
+    def __init__(self, pixels=PIXELS, bin_size=1):
+        self.capacity = 2 * pixels
+        self.bin_size = max(int(bin_size), 1)
+        self.low = np.empty(self.capacity, dtype=np.float32)
+        self.high = np.empty(self.capacity, dtype=np.float32)
+        self.count = 0
+        self.samples = 0
+        # bin being filled: samples in it so far, its min and max
+        self.__fill = 0
+        self.__low = self.__high = 0.0
+
+    def __compact(self):
+        half = self.count // 2
+        np.minimum(self.low[0:2 * half:2], self.low[1:2 * half:2],
+                   out=self.low[:half])
+        np.maximum(self.high[0:2 * half:2], self.high[1:2 * half:2],
+                   out=self.high[:half])
+        self.count = half
+        self.bin_size *= 2
+
+    def add(self, y):
+        y = np.asarray(y)
+        n = len(y)
+        self.samples += n
+        i = 0
+        while i < n:
+            if self.count == self.capacity:
+                self.__compact()
+            bs = self.bin_size
+            if self.__fill:
+                part = y[i:i + bs - self.__fill]
+                self.__low = min(self.__low, float(part.min()))
+                self.__high = max(self.__high, float(part.max()))
+                self.__fill += len(part)
+                i += len(part)
+                if self.__fill == bs:
+                    self.low[self.count] = self.__low
+                    self.high[self.count] = self.__high
+                    self.count += 1
+                    self.__fill = 0
+                continue
+            whole = min((n - i) // bs, self.capacity - self.count)
+            if whole:
+                bins = y[i:i + whole * bs].reshape(whole, bs)
+                bins.min(axis=1, out=self.low[self.count:self.count + whole])
+                bins.max(axis=1, out=self.high[self.count:self.count + whole])
+                self.count += whole
+                i += whole * bs
+            else:
+                part = y[i:]
+                self.__low = float(part.min())
+                self.__high = float(part.max())
+                self.__fill = len(part)
+                i = n
+
+    def envelope(self):
+        '''
+        (low, high) of every bin so far, the unfinished one included
+        '''
+        if not self.__fill:
+            return self.low[:self.count], self.high[:self.count]
+        return (np.append(self.low[:self.count], self.__low),
+                np.append(self.high[:self.count], self.__high))
+
+def plot_envelope(low, high, bin_ms, start_ms=0.0, ax=None):
+    '''
+    draws a min/max envelope whose bins are bin_ms long
+    '''
+    if ax is None:
+        plt.figure()
+        ax = plt.gca()
+    t = start_ms + bin_ms * np.arange(len(low))
+    ax.plot(np.repeat(t, 2), interleave(low, high))
+    ax.set_title('Amplitude')
+    ax.set_xlabel('time (ms)')
+    ax.set_ylabel('amplitude')
+    return ax
+
+def plot_samples(y, time, pixels=PIXELS, ax=None):
+    '''
+    plot of y covering time ms, reduced to pixels columns first
+    '''
+    y = np.asarray(y)
+    if np.iscomplexobj(y):
+        y = np.absolute(y)
+    accumulator = MinMaxAccumulator(pixels, -(-len(y) // pixels))
+    accumulator.add(y)
+    low, high = accumulator.envelope()
+    bin_ms = time * accumulator.bin_size / max(len(y), 1)
+    return plot_envelope(low, high, bin_ms, ax=ax)
+
+def capture_envelope(path, sample_rate=None, pixels=PIXELS, chunk=CHUNK):
+    '''
+    (low, high, bin_ms) of |iq| over a whole capture file, streamed in
+    chunks straight from the raw bytes
+    '''
+    reader = (CaptureReader(path) if sample_rate is None
+              else CaptureReader(path, sample_rate))
+    with reader:
+        accumulator = MinMaxAccumulator(pixels,
+                                        -(-len(reader) // pixels))
+        out = np.empty(chunk, dtype=np.float32)
+        for start in range(0, 2 * len(reader), 2 * chunk):
+            accumulator.add(bytes_to_envelope(
+                reader.raw[start:start + 2 * chunk], out))
+        bin_ms = accumulator.bin_size / reader.sample_rate * 1000
+    low, high = accumulator.envelope()
+    return low, high, bin_ms
+
+def plot_capture(path, sample_rate=None, pixels=PIXELS, ax=None):
+    low, high, bin_ms = capture_envelope(path, sample_rate, pixels)
+    return plot_envelope(low, high, bin_ms, ax=ax)
+
+class LivePlot:
+    """
+    Scrolling view of the last span_ms of a stream of amplitudes. update()
+    takes each new block; only the line is redrawn, over a saved copy of
+    the empty axes.
+
+    """
+    def __init__(self, span_ms, sample_rate, pixels=PIXELS,
+                 ylim=AMPLITUDE_RANGE):
+        self.bin_size = max(int(span_ms * sample_rate / 1000 / pixels), 1)
+        self.pixels = pixels
+        self.low = np.zeros(pixels, dtype=np.float32)
+        self.high = np.zeros(pixels, dtype=np.float32)
+        bin_ms = self.bin_size / sample_rate * 1000
+        # samples of a bin not finished by the last update
+        self.__pending = np.zeros(0, dtype=np.float32)
+
+        self.figure, self.ax = plt.subplots()
+        self.ax.set_title('Amplitude')
+        self.ax.set_xlabel('time (ms)')
+        self.ax.set_ylabel('amplitude')
+        self.ax.set_xlim(-pixels * bin_ms, 0)
+        self.ax.set_ylim(*ylim)
+        t = np.repeat(bin_ms * np.arange(-pixels + 1, 1), 2)
+        self.line, = self.ax.plot(t, interleave(self.low, self.high),
+                                  animated=True)
+        self.__background = None
+        self.figure.canvas.mpl_connect('draw_event', self.__on_draw)
+        plt.show(block=False)
+        self.figure.canvas.draw()
+
+    def __on_draw(self, event):
+        # a full redraw (first show, resize) invalidates the background
+        self.__background = self.figure.canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.line)
+
+    def update(self, amplitude):
+        data = np.concatenate((self.__pending, amplitude))
+        bins = len(data) // self.bin_size
+        self.__pending = data[bins * self.bin_size:]
+        if bins:
+            new = data[:bins * self.bin_size].reshape(bins, self.bin_size)
+            new = new[-self.pixels:]
+            k = len(new)
+            self.low[:-k] = self.low[k:]
+            self.high[:-k] = self.high[k:]
+            new.min(axis=1, out=self.low[-k:])
+            new.max(axis=1, out=self.high[-k:])
+        self.line.set_ydata(interleave(self.low, self.high))
+        canvas = self.figure.canvas
+        if self.__background is not None:
+            canvas.restore_region(self.__background)
+            self.ax.draw_artist(self.line)
+            canvas.blit(self.ax.bbox)
+        canvas.flush_events()
+
+    def close(self):
+        plt.close(self.figure)
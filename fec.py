@@ -0,0 +1,109 @@
+'''
+Forward error correction for transmitted payloads.
+Payload bits are coded with Hamming(7,4), which corrects one flipped bit
+per 7 bit codeword, then block interleaved: the codewords are split into
+blocks of at most depth codewords, as even as possible, and each block is
+sent one codeword bit at a time across all of its codewords. A run of
+lost or extra pulses no longer than the smallest block therefore hits
+every codeword at most once and is corrected; that is
+burst_tolerance(nbits, depth) bits, which is limited by the number of
+codewords and never more than depth: 2 for a 1 byte payload, 4 for 2
+bytes, depth once the codewords split into blocks of exactly depth.
+decode() undoes both on the receive side.
+'''
+
+import numpy as np
+
+# systematic Hamming(7,4): codeword = d1 d2 d3 d4 p1 p2 p3
+_P = np.array([[1, 1, 0],
+               [1, 0, 1],
+               [0, 1, 1],
+               [1, 1, 1]], dtype=np.uint8)
+G = np.hstack((np.eye(4, dtype=np.uint8), _P))
+H = np.hstack((_P.T, np.eye(3, dtype=np.uint8)))
+
+# syndrome (as a 3 bit number) -> position of the flipped bit, -1 for none
+_SYNDROME_POSITION = np.full(8, -1, dtype=np.int64)
+_SYNDROME_POSITION[H.T @ np.array([4, 2, 1])] = np.arange(7)
+
+# interleaver depth used when none is given: most codewords per block
+DEPTH = 7
+
+def _pad(bits, multiple):
+    bits = np.asarray(bits, dtype=np.uint8)
+    padded = np.zeros(-(-len(bits) // multiple) * multiple, dtype=np.uint8)
+    padded[:len(bits)] = bits
+    return padded
+
+def hamming_encode(bits):
+    '''
+    bits are zero padded to a multiple of 4; 7 coded bits per 4 in
+    '''
+    return (_pad(bits, 4).reshape(-1, 4) @ G % 2).astype(np.uint8).ravel()
+
+def hamming_decode(coded):
+    '''
+    returns (data bits, number of codewords that had a bit corrected)
+    '''
+    words = np.array(coded, dtype=np.uint8)[:len(coded) // 7 * 7].reshape(-1, 7)
+    syndromes = (words @ H.T % 2) @ np.array([4, 2, 1])
+    positions = _SYNDROME_POSITION[syndromes]
+    fix = np.flatnonzero(positions >= 0)
+    words[fix, positions[fix]] ^= 1
+    return words[:, :4].ravel(), len(fix)
+
+def _blocks(words, depth):
+    return max(-(-words // depth), 1)
+
+def _order(length, depth):
+    '''
+    index into the coded bits of each interleaved bit: codewords are the
+    rows of each block, read out column by column
+    '''
+    rows = np.arange(length).reshape(-1, 7)
+    return np.concatenate([block.T.ravel() for block in
+                           np.array_split(rows, _blocks(len(rows), depth))])
+
+def interleave(bits, depth=DEPTH):
+    '''
+    bits are zero padded to whole codewords; consecutive output bits come
+    from different codewords of the same block
+    '''
+    padded = _pad(bits, 7)
+    return padded[_order(len(padded), depth)]
+
+def deinterleave(bits, depth=DEPTH):
+    bits = np.asarray(bits, dtype=np.uint8)[:len(bits) // 7 * 7]
+    out = np.empty_like(bits)
+    out[_order(len(bits), depth)] = bits
+    return out
+
+def encode(bits, depth=DEPTH):
+    return interleave(hamming_encode(bits), depth)
+
+def decode(bits, nbits, depth=DEPTH):
+    '''
+    inverse of encode for a payload of nbits data bits;
+    returns (data bits, number of corrected codewords)
+    '''
+    data, corrected = hamming_decode(deinterleave(bits, depth))
+    return data[:nbits], corrected
+
+def decode_payload(bits, nbytes, depth=DEPTH):
+    data, corrected = decode(bits, 8 * nbytes, depth)
+    return np.packbits(data).tobytes(), corrected
+
+def encoded_length(nbits):
+    '''
+    coded bits for nbits data bits; the interleaver adds no padding, so
+    this does not depend on the depth
+    '''
+    return -(-nbits // 4) * 7
+
+def burst_tolerance(nbits, depth=DEPTH):
+    '''
+    longest run of bad bits that is always corrected in a payload of
+    nbits data bits: the size of its smallest interleaver block
+    '''
+    words = -(-nbits // 4)
+    return words // _blocks(words, depth)
@@ -6,7 +6,7 @@ from time import sleep
 import argparse
 import time
 
-from fprint_codes import check_call, callback_message
+from fprint_codes import check_call, callback_message, ABS_STATUS_TIMEOUT
 
 delay="""
 delay | ms  \n
@@ -61,6 +61,24 @@ def bsapi_callback(operation_param, message, data):
       print('error')
     return message
 
+class CALLBACK_STATE(Structure):
+    # what the pulse callback saw; the pulse operation's context points here
+    _fields_ = [("last_message", c_uint),
+                ("messages", c_uint)]
+
+def pulse_callback(operation_param, message, data):
+    # records instead of printing in the symbol loop; a plain function
+    # writing through the operation's context, so the thunk keeps no
+    # reference to the FMDevice and del fm still closes the session
+    state = cast(operation_param.contents.context,
+                 POINTER(CALLBACK_STATE)).contents
+    state.last_message = message
+    state.messages += 1
+    return message
+
+# one thunk shared by every session; it lives as long as the module
+PULSE_CALLBACK = CALLBACKFUNC(pulse_callback)
+
 class FMDevice:
     """
     Connection to a Fingerprint Module (FM) using the UPEK Biometric
@@ -83,7 +101,46 @@ class FMDevice:
         check_call(self.__bsapi.ABSOpen(b"usb",
                                         byref(self.__conn_handle)))
         self.image_format = self.__get_image_format()
-
+        self.__prepare_pulse()
+
+
+    def __prepare_pulse(self):
+        # everything test() needs is built once per session so the symbol
+        # loop only makes the foreign call
+        self.__grab = self.__bsapi.ABSGrabImage
+        self.__grab.argtypes = [c_int, # connection handle
+                                POINTER(ABS_OPERATION),
+                                c_uint, # purpose
+                                POINTER(ABS_IMAGE_FORMAT),
+                                POINTER(POINTER(ABS_IMAGE)),
+                                c_void_p, # swipe info
+                                c_void_p, # reserved
+                                c_uint] # flags
+        self.__grab.restype = c_int
+
+        # the callback records the messages of each pulse into __state
+        self.__state = CALLBACK_STATE()
+        self.__operation = ABS_OPERATION(
+            0, # operation ID; doesn't matter
+            addressof(self.__state), # data to pass to callback
+            PULSE_CALLBACK,
+            self.timeout, # timeout
+            0x1) # callback flag (nowait)
+        self.__image = POINTER(ABS_IMAGE)()
+        self.__pulse_args = (self.__conn_handle,
+                             byref(self.__operation),
+                             0, # ABS_PURPOSE_UNDEFINED
+                             byref(self.image_format),
+                             byref(self.__image),
+                             None, None, 0)
+
+    @property
+    def last_message(self):
+        return self.__state.last_message
+
+    @property
+    def messages(self):
+        return self.__state.messages
 
     def __get_image_format(self):
         num_formats = c_uint()
@@ -146,23 +203,20 @@ class FMDevice:
 
        #return image
 
-    def test(self):
-
-        operation_parameters = ABS_OPERATION(
-            0, # operation ID; doesn't matter
-            None, # data to pass to callback
-            CALLBACKFUNC(bsapi_callback),
-            self.timeout, # timeout
-            0x1) # callback flag (nowait)
+    def pulse(self):
+        """
+        Key one burst using the operation prepared in __init__ and return
+        the BSAPI status. A timeout is the expected outcome of a pulse.
 
-        image = POINTER(ABS_IMAGE)()
+        """
+        self.__state.messages = 0
+        return self.__grab(*self.__pulse_args)
 
-        check_call(self.__bsapi.ABSGrabImage(self.__conn_handle,
-            byref(operation_parameters), 0, # ABS_PURPOSE_UNDEFINED
-            byref(self.image_format), byref(image), # what we want!
-            None, # swipe info, if desired
-            None, # reserved
-            0)) # flags
+    def test(self):
+        status = self.pulse()
+        if status != ABS_STATUS_TIMEOUT:
+            check_call(status)
+        return status
 
     def __del__(self):
         if self.__conn_handle.value:
@@ -0,0 +1,119 @@
+'''
+Turns payloads into the bit arrays (or line coded pulse schedules) keyed
+by send_code.
+A frame is a preamble (the 13 bit barker code by default) followed by the
+payload bytes, MSB first. Conversion is one np.unpackbits call, and frames
+that are sent over and over are cached so they are only encoded once.
+'''
+
+from collections import OrderedDict, namedtuple
+
+import fec
+import numpy as np
+from line_codes import Schedule
+
+# 13 bit barker code, already in bits
+BARKER_13 = np.array([1, 1, 1, 1, 1, 0, 0, 1, 1, 0, 1, 0, 1], dtype="uint8")
+
+Frame = namedtuple("Frame", ["preamble", "payload"])
+
+def bytes_to_bits(data):
+    '''
+    bytes, bytearray, an int 0-255 or any uint8 array -> uint8 array of
+    0/1 values, MSB first
+    '''
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = np.frombuffer(data, dtype=np.uint8)
+    return np.unpackbits(np.asarray(data, dtype=np.uint8).ravel())
+
+def as_bits(code):
+    '''
+    normalizes an already binary code ("0101", [0, 1, 0, 1] or an array)
+    to a uint8 array of 0/1 values
+    '''
+    if isinstance(code, str):
+        return np.frombuffer(code.encode("ascii"), dtype=np.uint8) - ord("0")
+    return np.asarray(code, dtype=np.uint8)
+
+def payload_key(payload):
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        return bytes(payload)
+    return bytes(np.asarray(payload, dtype=np.uint8).ravel())
+
+class FrameEncoder:
+    """
+    Encodes Frame(preamble, payload) into one bit array, or with a line
+    code (see line_codes.py) into the pulse Schedule for the scheduler.
+    encode() and schedule() take a Frame, or just the payload to send
+    behind this encoder's preamble.
+    The preamble is always keyed as plain pulses, spaced by the line
+    code's closest pulse spacing, so the receiver can sync on it the same
+    way for every code. With fec_depth set, the payload bits are Hamming
+    coded and interleaved with that depth first (see fec.py).
+    The most recently used cache_size frames are kept, read-only, keyed by
+    their preamble and payload bytes.
+
+    """
+    def __init__(self, preamble=BARKER_13, line_code=None, fec_depth=None,
+                 cache_size=64):
+        self.preamble = as_bits(preamble)
+        self.__preamble_key = self.preamble.tobytes()
+        self.line_code = line_code
+        self.fec_depth = fec_depth
+        self.cache_size = cache_size
+        self.__cache = OrderedDict()
+
+    def frame(self, payload):
+        return Frame(self.preamble, payload)
+
+    def __split(self, frame):
+        '''
+        (preamble bits, cache key of the preamble, payload key) of a
+        Frame or a bare payload
+        '''
+        if isinstance(frame, Frame):
+            preamble = as_bits(frame.preamble)
+            return preamble, preamble.tobytes(), payload_key(frame.payload)
+        return self.preamble, self.__preamble_key, payload_key(frame)
+
+    def __cached(self, key, build):
+        value = self.__cache.get(key)
+        if value is not None:
+            self.__cache.move_to_end(key)
+            return value
+        value = build()
+        self.__cache[key] = value
+        if len(self.__cache) > self.cache_size:
+            self.__cache.popitem(last=False)
+        return value
+
+    def payload_bits(self, key):
+        bits = bytes_to_bits(key)
+        if self.fec_depth:
+            bits = fec.encode(bits, self.fec_depth)
+        return bits
+
+    def encode(self, frame):
+        preamble, preamble_key, key = self.__split(frame)
+        def build():
+            bits = np.concatenate((preamble, self.payload_bits(key)))
+            bits.flags.writeable = False
+            return bits
+        return self.__cached((preamble_key, key), build)
+
+    def schedule(self, frame, line_code=None):
+        line_code = line_code or self.line_code
+        preamble, preamble_key, key = self.__split(frame)
+        def build():
+            spacing = line_code.pulse_spacing_ns
+            preamble_offsets = (np.flatnonzero(preamble).astype(np.int64)
+                                * spacing)
+            preamble_ns = spacing * len(preamble)
+            payload_schedule = line_code.schedule(self.payload_bits(key))
+            offsets = np.concatenate((preamble_offsets,
+                                      payload_schedule.offsets_ns
+                                      + preamble_ns))
+            offsets.flags.writeable = False
+            return Schedule(offsets,
+                            preamble_ns + payload_schedule.duration_ns)
+        return self.__cached((preamble_key, key, line_code.key), build)
@@ -0,0 +1,55 @@
+'''
+Conversion of raw RTL-SDR bytes (interleaved uint8 I/Q) to complex64.
+A 256 entry table maps each byte straight to its float value,
+byte / 127.5 - 1 as in sdr.sdr_read_file, and since a complex64 array is
+just interleaved float32 I/Q, np.take fills the output in place.
+When only the envelope is wanted, IQ_MAGNITUDE_LUT does the same for |iq|
+from each I/Q byte pair read as one uint16.
+'''
+
+import numpy as np
+
+IQ_LUT = (np.arange(256, dtype=np.float64) / (255.0 / 2.0) - 1
+          ).astype(np.float32)
+
+# bytes per np.take call: take copies its indices to intp first, so one
+# call over a whole capture would need 8 bytes of scratch per byte
+TAKE_BLOCK = 1 << 17
+
+# |iq| of every I/Q byte pair, indexed by the pair as a native uint16
+IQ_MAGNITUDE_LUT = np.abs(
+    IQ_LUT[np.arange(1 << 16, dtype=np.uint16).view(np.uint8)]
+    .astype(np.float32).view(np.complex64)).astype(np.float32)
+
+def bytes_to_iq(raw, out=None):
+    '''
+    raw: uint8 array (or buffer) of interleaved I/Q. Writes into out
+    (complex64, at least len(raw) // 2 long) when given and returns the
+    filled part.
+    '''
+    raw = np.frombuffer(raw, dtype=np.uint8) \
+        if not isinstance(raw, np.ndarray) else raw
+    n = len(raw) // 2
+    if out is None:
+        out = np.empty(n, dtype=np.complex64)
+    out = out[:n]
+    floats = out.view(np.float32)
+    for start in range(0, 2 * n, TAKE_BLOCK):
+        stop = min(start + TAKE_BLOCK, 2 * n)
+        np.take(IQ_LUT, raw[start:stop], out=floats[start:stop])
+    return out
+
+def bytes_to_envelope(raw, out=None):
+    '''
+    same as np.abs(bytes_to_iq(raw)) without the complex samples
+    '''
+    raw = np.frombuffer(raw, dtype=np.uint8) \
+        if not isinstance(raw, np.ndarray) else raw
+    pairs = np.ascontiguousarray(raw[:len(raw) // 2 * 2]).view(np.uint16)
+    if out is None:
+        out = np.empty(len(pairs), dtype=np.float32)
+    out = out[:len(pairs)]
+    for start in range(0, len(pairs), TAKE_BLOCK // 2):
+        stop = start + TAKE_BLOCK // 2
+        np.take(IQ_MAGNITUDE_LUT, pairs[start:stop], out=out[start:stop])
+    return out
@@ -0,0 +1,123 @@
+'''
+Line codes for keying bits with the fingerprint sensor.
+A line code turns bits into a Schedule: the start time of every pulse,
+in ns from the start of the frame, and the length of the frame. The
+scheduler keys the pulses on those times, and decode() goes back from
+pulse times to bits.
+
+OOK         1 = pulse, 0 = silent symbol (what modulator.py always did)
+Manchester  every bit is one pulse, in the first half of the symbol for a
+            0 and in the second half for a 1, so long runs of zeros still
+            carry a clock
+PPM         bits_per_symbol bits pick one of 2**bits_per_symbol slots for
+            a single pulse; slots only need to be as wide as the timing
+            resolution, not as the burst, so one burst carries several bits
+'''
+
+from collections import namedtuple
+
+import numpy as np
+
+Schedule = namedtuple("Schedule", ["offsets_ns", "duration_ns"])
+
+def ms_to_ns(ms):
+    return int(round(ms * 1000000))
+
+def _pulse_offsets(chips, chip_ns):
+    return np.flatnonzero(chips).astype(np.int64) * chip_ns
+
+class OOK:
+    """On-off keying, one symbol_period_ms slot per bit."""
+    name = "ook"
+
+    def __init__(self, symbol_period_ms):
+        self.symbol_ns = ms_to_ns(symbol_period_ms)
+        # closest two pulses can ever be
+        self.pulse_spacing_ns = self.symbol_ns
+        self.key = (self.name, self.symbol_ns)
+
+    def schedule(self, bits):
+        bits = np.asarray(bits, dtype=np.uint8)
+        return Schedule(_pulse_offsets(bits, self.symbol_ns),
+                        self.symbol_ns * len(bits))
+
+    def decode(self, offsets_ns, nbits):
+        bits = np.zeros(nbits, dtype=np.uint8)
+        slots = np.rint(np.asarray(offsets_ns) / self.symbol_ns).astype(np.int64)
+        bits[slots[(slots >= 0) & (slots < nbits)]] = 1
+        return bits
+
+class Manchester:
+    """
+    IEEE 802.3 convention: 0 is high-low, 1 is low-high. Each half symbol
+    has to fit one burst.
+
+    """
+    name = "manchester"
+
+    def __init__(self, symbol_period_ms):
+        self.symbol_ns = ms_to_ns(symbol_period_ms)
+        self.half_ns = self.symbol_ns // 2
+        self.pulse_spacing_ns = self.half_ns
+        self.key = (self.name, self.symbol_ns)
+
+    def schedule(self, bits):
+        bits = np.asarray(bits, dtype=np.uint8)
+        chips = np.empty(2 * len(bits), dtype=np.uint8)
+        chips[0::2] = 1 - bits
+        chips[1::2] = bits
+        return Schedule(_pulse_offsets(chips, self.half_ns),
+                        self.symbol_ns * len(bits))
+
+    def decode(self, offsets_ns, nbits):
+        halves = np.rint(np.asarray(offsets_ns) / self.half_ns).astype(np.int64)
+        halves = halves[(halves >= 0) & (halves < 2 * nbits)]
+        bits = np.zeros(nbits, dtype=np.uint8)
+        bits[halves // 2] = halves % 2
+        return bits
+
+class PPM:
+    """
+    M-ary pulse position modulation, M = 2**bits_per_symbol.
+    A symbol is M slots of slot_ms followed by guard_ms, which has to be
+    long enough for a burst started in the last slot to end before the
+    next symbol. Bits are padded with zeros to a whole symbol.
+
+    """
+    name = "ppm"
+
+    def __init__(self, slot_ms, guard_ms, bits_per_symbol=2):
+        self.bits_per_symbol = bits_per_symbol
+        self.slots = 1 << bits_per_symbol
+        self.slot_ns = ms_to_ns(slot_ms)
+        self.symbol_ns = self.slots * self.slot_ns + ms_to_ns(guard_ms)
+        self.pulse_spacing_ns = self.symbol_ns - (self.slots - 1) * self.slot_ns
+        self.key = (self.name, self.slot_ns, self.symbol_ns, bits_per_symbol)
+        self.__weights = 1 << np.arange(bits_per_symbol - 1, -1, -1)
+
+    def symbols(self, bits):
+        bits = np.asarray(bits, dtype=np.uint8)
+        k = self.bits_per_symbol
+        padded = np.zeros(-(-len(bits) // k) * k, dtype=np.int64)
+        padded[:len(bits)] = bits
+        return padded.reshape(-1, k) @ self.__weights
+
+    def schedule(self, bits):
+        values = self.symbols(bits)
+        offsets = (np.arange(len(values), dtype=np.int64) * self.symbol_ns
+                   + values * self.slot_ns)
+        return Schedule(offsets, self.symbol_ns * len(values))
+
+    def decode(self, offsets_ns, nbits):
+        offsets = np.asarray(offsets_ns, dtype=np.int64)
+        nsymbols = -(-nbits // self.bits_per_symbol)
+        index = offsets // self.symbol_ns
+        keep = (index >= 0) & (index < nsymbols)
+        values = np.zeros(nsymbols, dtype=np.int64)
+        values[index[keep]] = np.clip(np.rint(
+            (offsets[keep] - index[keep] * self.symbol_ns) / self.slot_ns),
+            0, self.slots - 1)
+        bits = (values[:, None] & self.__weights) != 0
+        return bits.astype(np.uint8).ravel()[:nbits]
+
+LINE_CODES = {"ook": OOK, "manchester": Manchester, "ppm": PPM}
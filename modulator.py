@@ -10,10 +10,18 @@ from ctypes import *
 from ctypes.util import find_library
 from time import sleep
 import argparse
+import itertools
 import time
 
+import fec
 import numpy as np
-from fprint_codes import check_call, callback_message
+import stream_framing
+from fprint_codes import check_call, callback_message, ABS_STATUS_TIMEOUT
+from frame_encoder import BARKER_13, FrameEncoder, as_bits, bytes_to_bits
+from line_codes import OOK
+from scheduler import SymbolScheduler
+from timing_profile import load_profile, symbol_period_for
+from tracing import SymbolTrace
 
 delay="""
 delay | ms  \n
@@ -60,6 +68,37 @@ ABS_OPERATION._fields_ = [("operation_id", c_uint),
                           ("timeout", c_int),
                           ("flags", c_uint)]
 
+class ABS_DEVICE_LIST_ITEM(Structure):
+    # layout of abs_device_list_item in bstypes.h
+    _fields_ = [("DsnSubString", c_char * 260),
+                ("reserved", c_ubyte * 256)]
+
+class ABS_DEVICE_LIST(Structure):
+    # List really holds NumDevices items
+    _fields_ = [("NumDevices", c_uint),
+                ("List", ABS_DEVICE_LIST_ITEM * 1)]
+
+def enumerate_devices(dsn=b"usb"):
+    """
+    DSN strings of every attached device matching dsn, for FMDevice(t, dsn)
+
+    """
+    bsapi = CDLL(find_library("bsapi"))
+    check_call(bsapi.ABSInitialize())
+    dev_list = POINTER(ABS_DEVICE_LIST)()
+    check_call(bsapi.ABSEnumerateDevices(dsn, byref(dev_list)))
+    count = dev_list.contents.NumDevices
+    items = cast(byref(dev_list.contents.List),
+                 POINTER(ABS_DEVICE_LIST_ITEM * count)).contents
+    dsns = [item.DsnSubString for item in items]
+    bsapi.ABSFree(dev_list)
+    bsapi.ABSTerminate()
+    return dsns
+
+# every grab gets its own non-zero operation ID so it can be cancelled
+# with ABSCancelOperation from another thread (0 means not cancellable)
+operation_ids = itertools.count(1)
+
 def bsapi_callback(operation_param, message, data):
     try:
       msg = callback_message(message)
@@ -68,14 +107,33 @@ def bsapi_callback(operation_param, message, data):
       print('error')
     return message
 
+class CALLBACK_STATE(Structure):
+    # what the pulse callback saw; the pulse operation's context points here
+    _fields_ = [("last_message", c_uint),
+                ("messages", c_uint)]
+
+def pulse_callback(operation_param, message, data):
+    # records instead of printing in the symbol loop; a plain function
+    # writing through the operation's context, so the thunk keeps no
+    # reference to the FMDevice and del fm still closes the session
+    state = cast(operation_param.contents.context,
+                 POINTER(CALLBACK_STATE)).contents
+    state.last_message = message
+    state.messages += 1
+    return message
+
+# one thunk shared by every session; it lives as long as the module
+PULSE_CALLBACK = CALLBACKFUNC(pulse_callback)
+
 class FMDevice:
     """
     Connection to a Fingerprint Module (FM) using the UPEK Biometric
     Services API
 
     """
-    def __init__(self, t):
+    def __init__(self, t, dsn=b"usb"):
         self.timeout = t
+        self.dsn = dsn
 
         # load libbsapi.so; must be located in /usr/lib or /usr/lib64
         self.__bsapi = CDLL(find_library("bsapi"))
@@ -83,14 +141,58 @@ class FMDevice:
         # initialize the bsapi subsystem
         check_call(self.__bsapi.ABSInitialize())
 
-        # open a connection to a usb device
+        # open a connection to a usb device (the first one, unless dsn
+        # names one from enumerate_devices())
         self.__conn_handle = c_int(0)
         # use a byte string to produce a c_char_p instead of a
         # c_wchar_p
-        check_call(self.__bsapi.ABSOpen(b"usb",
+        check_call(self.__bsapi.ABSOpen(dsn,
                                         byref(self.__conn_handle)))
         self.image_format = self.__get_image_format()
-
+        self.__prepare_pulse()
+
+
+    def __prepare_pulse(self):
+        # everything test() needs is built once per session so the symbol
+        # loop only makes the foreign call
+        self.__grab = self.__bsapi.ABSGrabImage
+        self.__grab.argtypes = [c_int, # connection handle
+                                POINTER(ABS_OPERATION),
+                                c_uint, # purpose
+                                POINTER(ABS_IMAGE_FORMAT),
+                                POINTER(POINTER(ABS_IMAGE)),
+                                c_void_p, # swipe info
+                                c_void_p, # reserved
+                                c_uint] # flags
+        self.__grab.restype = c_int
+        self.__cancel = self.__bsapi.ABSCancelOperation
+        self.__cancel.argtypes = [c_int, c_uint]
+        self.__cancel.restype = c_int
+        self.operation_id = 0
+
+        # the callback records the messages of each pulse into __state
+        self.__state = CALLBACK_STATE()
+        self.__operation = ABS_OPERATION(
+            0, # operation ID; set for every pulse
+            addressof(self.__state), # data to pass to callback
+            PULSE_CALLBACK,
+            self.timeout, # timeout
+            0x1) # callback flag (nowait)
+        self.__image = POINTER(ABS_IMAGE)()
+        self.__pulse_args = (self.__conn_handle,
+                             byref(self.__operation),
+                             0, # ABS_PURPOSE_UNDEFINED
+                             byref(self.image_format),
+                             byref(self.__image),
+                             None, None, 0)
+
+    @property
+    def last_message(self):
+        return self.__state.last_message
+
+    @property
+    def messages(self):
+        return self.__state.messages
 
     def __get_image_format(self):
         num_formats = c_uint()
@@ -118,8 +220,9 @@ class FMDevice:
 
        #try:
        #  print("before")
+        self.operation_id = next(operation_ids)
         operation_parameters = ABS_OPERATION(
-            0, # operation ID; doesn't matter
+            self.operation_id,
             None, # data to pass to callback
             CALLBACKFUNC(bsapi_callback),
             1, # timeout
@@ -153,89 +256,128 @@ class FMDevice:
 
        #return image
 
-    def test(self):
+    def pulse(self):
+        """
+        Key one burst using the operation prepared in __init__ and return
+        the BSAPI status. A timeout is the expected outcome of a pulse,
+        ABS_STATUS_CANCELED the outcome of cancel().
 
-        operation_parameters = ABS_OPERATION(
-            0, # operation ID; doesn't matter
-            None, # data to pass to callback
-            CALLBACKFUNC(bsapi_callback),
-            self.timeout, # timeout
-            0x1) # callback flag (nowait)
+        """
+        self.operation_id = self.__operation.operation_id = next(operation_ids)
+        self.__state.messages = 0
+        return self.__grab(*self.__pulse_args)
 
-        image = POINTER(ABS_IMAGE)()
+    def cancel(self):
+        """
+        Aborts the grab in progress; meant to be called from another
+        thread. Returns ABS_STATUS_NO_SUCH_OPERATION if it already ended.
 
-        check_call(self.__bsapi.ABSGrabImage(self.__conn_handle,
-            byref(operation_parameters), 0, # ABS_PURPOSE_UNDEFINED
-            byref(self.image_format), byref(image), # what we want!
-            None, # swipe info, if desired
-            None, # reserved
-            0)) # flags
+        """
+        return self.__cancel(self.__conn_handle, self.operation_id)
 
-    def __del__(self):
+    def set_timeout(self, t):
+        self.timeout = t
+        self.__operation.timeout = t
+
+    def test(self):
+        status = self.pulse()
+        if status != ABS_STATUS_TIMEOUT:
+            check_call(status)
+        return status
+
+    def close(self):
+        if self.__bsapi is None:
+            return
         if self.__conn_handle.value:
             # close connection
             self.__bsapi.ABSClose(self.__conn_handle)
+            self.__conn_handle.value = 0
 
         # close out the bsapi subsystem
         self.__bsapi.ABSTerminate()
+        self.__bsapi = None
+
+    def __del__(self):
+        self.close()
+
+
+PAYLOAD = [170] #170 converts to "10101010"
+
+PULSE_TIMEOUT = 50
 
+# number of times main() sends the frame, without and with FEC; FEC only
+# corrects bursts of up to fec.burst_tolerance() bits, 2 for PAYLOAD, so
+# it saves repeats but does not replace them
+REPEATS = 100
+FEC_REPEATS = 10
 
-def main():
-  preamble_data = [1, 1, 1, 1, 1, 0, 0, 1, 1, 0, 1, 0, 1] # 13 bit barker code, 
-  #preamble_data = [1, 1, 1, 1, 1]
+def main(line_code=None, fec_depth=None, repeats=None, trace=None,
+         trace_path=None):
   # if you want to change, make sure it is an uint8
-  preamble = np.array(preamble_data, dtype="uint8") # 31, 53 is standard
-  fm = FMDevice(50)
-  print("Sending preamble")
-  binary_code = preamble
-  # binary_code = uint8_to_binary(preamble) # only needed if preamble_data needs to be converted from byte to bit
-  send_code(string=binary_code, fm=fm)
-  print("preamble done")
-  send_payload(fm)
-  time.sleep(.250)
-  for i in range(99):
-    send_code(string=binary_code, fm=fm)
-    send_payload(fm)
+  preamble = BARKER_13 # 31, 53 is standard
+  fm = FMDevice(PULSE_TIMEOUT)
+  # symbol period comes from the calibrated profile when there is one
+  symbol_period_ms = symbol_period_for(load_profile(), PULSE_TIMEOUT)
+  if line_code is None:
+    line_code = OOK(symbol_period_ms)
+  if repeats is None:
+    repeats = FEC_REPEATS if fec_depth else REPEATS
+  # pulse timings, looked at once the frames are out; see tracing.py
+  if trace is None:
+    trace = SymbolTrace()
+  encoder = FrameEncoder(preamble, line_code, fec_depth)
+  print("Sending frame")
+  # encoded once; the repeats come straight from the encoder cache
+  for i in range(repeats):
+    send_schedule(encoder.schedule(PAYLOAD), fm, trace)
     time.sleep(.250)
+  print("frame done")
+  print(trace.summary())
+  if trace_path:
+    trace.save_json(trace_path)
 
   # send_code(string="01001010101010101010101010101010101010101010101010101010101010101010101010101010101010101010101010101010101010101010101", fm=fm)
 
 
 def uint8_to_binary(uint8):
-  binary_code = ""
-  for x in range(uint8.size):
-    bin_val = bin(uint8[x])
-    for y in range(8 - (len(bin_val) - 2)):
-      binary_code += "0"
-    for y in range(len(bin_val) - 2):
-      binary_code += bin_val[y + 2]
-  return binary_code
-
-def send_code(string, fm):
-  for i in range(len(string)):
-    if (string[i] == "1") or (string[i] == 1):
-      #t1 = time.time()
-      try:
-        fm.test()
-      except KeyboardInterrupt:
-        del fm
-        quit()
-      except:
-        pass
-        print("1")
-      #t2 = time.time()
-      #print("1 time = " + str(t2 - t1))
-    else:
-      #t1 = time.time()
-      time.sleep(177/1000.0)
-      #t2 = time.time()
-      #print("0 time = " + str(t2 - t1))
-      print("0")
-    
-def send_payload(fm):
-  payload_data = [170] #170 converts to "10101010"
-  payload = np.array(payload_data, dtype="uint8")
-  send_code(uint8_to_binary(payload), fm)
+  return bytes_to_bits(uint8)
+
+def send_code(string, fm, symbol_period_ms=None, line_code=None,
+              fec_depth=None, trace=None):
+  # plain OOK unless another line code (line_codes.py) is given, with the
+  # period calibrated for fm's timeout unless one is given
+  if line_code is None:
+    if symbol_period_ms is None:
+      symbol_period_ms = symbol_period_for(load_profile(), fm.timeout)
+    line_code = OOK(symbol_period_ms)
+  bits = as_bits(string)
+  if fec_depth:
+    bits = fec.encode(bits, fec_depth)
+  send_schedule(line_code.schedule(bits), fm, trace)
+
+def send_schedule(schedule, fm, trace=None):
+  # every pulse is placed on an absolute grid, see scheduler.py; with a
+  # tracing.SymbolTrace, each one is recorded in it
+  try:
+    SymbolScheduler(fm, trace=trace).send_schedule(*schedule)
+  except KeyboardInterrupt:
+    del fm
+    quit()
+
+def send_stream(source, fm, line_code=None, fec_depth=None,
+                chunk=stream_framing.CHUNK, trace=None):
+  # file or byte iterator, one sequenced frame per chunk; see
+  # stream_framing.py
+  if line_code is None:
+    line_code = OOK(symbol_period_for(load_profile(), fm.timeout))
+  encoder = FrameEncoder(BARKER_13, line_code, fec_depth)
+  return stream_framing.send_stream(
+      source, lambda frame: send_schedule(encoder.schedule(frame), fm, trace),
+      chunk)
+
+def send_payload(fm, fec_depth=None, trace=None):
+  payload = np.array(PAYLOAD, dtype="uint8")
+  send_code(uint8_to_binary(payload), fm, fec_depth=fec_depth, trace=trace)
 
 
 
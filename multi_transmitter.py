@@ -0,0 +1,165 @@
+'''
+Transmits through every attached sensor at once.
+Each device gets its own Transmitter (one session, one worker thread), and
+submitted payloads are either striped, each one going to the least busy
+device so the aggregate frame rate grows with the number of sensors, or
+replicated, every device keying the same frame on the same start time for
+spatial redundancy. The start of a replicated frame is agreed on when the
+devices' workers pick it up (SharedStart), so a device still busy with an
+earlier frame delays the others instead of missing the start.
+With stub_device.StubFMDevice the whole thing runs without hardware.
+'''
+
+from concurrent.futures import CancelledError, Future
+import itertools
+import threading
+import time
+
+from modulator import FMDevice, PULSE_TIMEOUT, enumerate_devices
+from scheduler import TransmitCancelled
+from transmitter import Transmitter
+
+STRIPE = "stripe"
+REPLICATE = "replicate"
+
+# how far ahead of the moment every worker is ready a replicated frame
+# starts, so all of them get to their first deadline in time
+REPLICATE_LEAD_NS = 5000000
+
+# longest a worker waits for the others to pick up the same replicated
+# frame, in seconds; only reached when queues got out of step (payloads of
+# different priorities racing), and the frame then fails instead of hanging
+REPLICATE_SYNC_S = 30.0
+
+def open_devices(timeout=PULSE_TIMEOUT, dsns=None, open_device=FMDevice):
+    '''
+    one session per attached device (or per DSN in dsns)
+    '''
+    if dsns is None:
+        dsns = enumerate_devices()
+    return [open_device(timeout, dsn) for dsn in dsns]
+
+def all_of(futures):
+    '''
+    future that finishes with the list of results once all futures have,
+    or with the first exception (CancelledError if one was cancelled)
+    '''
+    combined = Future()
+    combined.set_running_or_notify_cancel()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+    def done(f):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if not last or combined.done():
+            return
+        for g in futures:
+            if g.cancelled():
+                combined.set_exception(CancelledError())
+                return
+        errors = [g.exception() for g in futures if g.exception()]
+        if errors:
+            combined.set_exception(errors[0])
+        else:
+            combined.set_result([g.result() for g in futures])
+    for f in futures:
+        f.add_done_callback(done)
+    return combined
+
+class SharedStart:
+    """
+    Start time of one replicated frame, agreed on by the workers of every
+    device when they pick it up (Transmitter.submit with a callable
+    start_ns). Each worker arrives with the end of its previous frame; the
+    last one to arrive sets the start to REPLICATE_LEAD_NS after the
+    latest of those and of now, and all of them key from there. abort()
+    releases the waiting workers when one of the copies will never
+    arrive (cancelled or failed in the queue).
+
+    """
+    def __init__(self, parties, lead_ns=REPLICATE_LEAD_NS,
+                 timeout=REPLICATE_SYNC_S):
+        self.start_ns = None
+        self.timeout = timeout
+        self.__lead_ns = lead_ns
+        self.__ready_ns = 0
+        self.__lock = threading.Lock()
+        self.__barrier = threading.Barrier(parties, self.__choose)
+
+    def __choose(self):
+        self.start_ns = (max(self.__ready_ns, time.monotonic_ns())
+                         + self.__lead_ns)
+
+    def __call__(self, previous_end_ns):
+        with self.__lock:
+            self.__ready_ns = max(self.__ready_ns, previous_end_ns)
+        try:
+            self.__barrier.wait(self.timeout)
+        except threading.BrokenBarrierError:
+            self.__barrier.abort()
+            raise TransmitCancelled("replicated frame lost its other copies")
+        return self.start_ns
+
+    def abort(self):
+        self.__barrier.abort()
+
+class MultiTransmitter:
+    """
+    Transmitter over several devices. Extra keyword arguments go to every
+    per-device Transmitter (line_code, fec_depth, max_queue, ...).
+
+    """
+    def __init__(self, devices, mode=STRIPE, **kwargs):
+        if mode not in (STRIPE, REPLICATE):
+            raise ValueError("mode must be {} or {}".format(STRIPE, REPLICATE))
+        self.mode = mode
+        self.transmitters = [Transmitter(fm, **kwargs) for fm in devices]
+        self.__next = itertools.cycle(range(len(self.transmitters)))
+
+    def __least_busy(self):
+        # round robin among the devices with the shortest queue
+        shortest = min(t.qsize() for t in self.transmitters)
+        for i in self.__next:
+            if self.transmitters[i].qsize() == shortest:
+                return self.transmitters[i]
+
+    def submit(self, payload, priority=0, repeats=1, block=True,
+               timeout=None, deadline_ns=None):
+        """
+        Striped: the future of the one device that sends payload.
+        Replicated: a future for the list of every device's result.
+
+        """
+        if self.mode == STRIPE:
+            return self.__least_busy().submit(payload, priority, repeats,
+                                              block, timeout, deadline_ns)
+        start = SharedStart(len(self.transmitters))
+        futures = [t.submit(payload, priority, repeats, block, timeout,
+                            deadline_ns, start)
+                   for t in self.transmitters]
+        def gone(f):
+            # a copy that never reaches the start must not hold the rest
+            if f.cancelled() or (f.exception() is not None
+                                 and start.start_ns is None):
+                start.abort()
+        for f in futures:
+            f.add_done_callback(gone)
+        return all_of(futures)
+
+    def cancel(self, pending=False):
+        for t in self.transmitters:
+            t.cancel(pending)
+
+    def close(self, wait=True):
+        for t in self.transmitters:
+            t.close(wait=False)
+        if wait:
+            for t in self.transmitters:
+                t.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
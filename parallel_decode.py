@@ -0,0 +1,181 @@
+'''
+Decodes every OOK frame in a capture file, using all cores.
+The capture is split into sample ranges and each range is decoded in its
+own process: the worker memory maps the file itself (only the path and
+the range are sent to it), and runs channel_filter -> envelope ->
+preamble_sync -> per-symbol slicing on its part. A range is read with a
+margin on both sides, enough to warm up the filter before it and to hold
+a whole frame after it, so a frame crossing the boundary is still seen
+whole; a range only reports frames whose preamble starts inside it.
+Frames found twice anyway (a detection a few samples either side of a
+boundary) are merged, keeping the better score.
+'''
+
+import argparse
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import fec
+from capture_reader import CaptureReader
+from channel_filter import ChannelFilter, DECIMATION
+from demod import SMOOTH_MS, slice_symbols, smooth
+from frame_encoder import BARKER_13, as_bits
+from preamble_sync import PreambleCorrelator, THRESHOLD, preamble_template
+from radio_config import SAMPLE_RATE
+
+# ranges per worker, so a slow range doesn't leave the other cores idle
+RANGES_PER_WORKER = 4
+
+# shortest range, in frames: every range also reads a frame of margin
+MIN_RANGE_FRAMES = 8
+
+DecodeParams = namedtuple("DecodeParams", [
+    "symbol_period_ms", "burst_ms", "nbytes", "fec_depth", "offset_hz",
+    "decimation", "threshold", "sample_rate"])
+
+DecodedFrame = namedtuple("DecodedFrame", [
+    "sample", "score", "bits", "payload", "corrected"])
+
+def decode_params(symbol_period_ms, nbytes, burst_ms=None, fec_depth=None,
+                  offset_hz=0.0, decimation=DECIMATION, threshold=THRESHOLD,
+                  sample_rate=SAMPLE_RATE):
+    return DecodeParams(symbol_period_ms, burst_ms, nbytes, fec_depth,
+                        offset_hz, decimation, threshold, sample_rate)
+
+def payload_symbols(params):
+    nbits = 8 * params.nbytes
+    if params.fec_depth:
+        return fec.encoded_length(nbits)
+    return nbits
+
+def frame_samples(params):
+    '''
+    length of a whole frame in capture samples
+    '''
+    symbols = len(BARKER_13) + payload_symbols(params)
+    return int(symbols * params.symbol_period_ms * params.sample_rate / 1000)
+
+def split_ranges(num_samples, range_samples):
+    return [(start, min(start + range_samples, num_samples))
+            for start in range(0, num_samples, range_samples)]
+
+def _frame_bits(smoothed, start, sps, preamble, nsymbols):
+    frame = smoothed[start:start + nsymbols * sps]
+    if len(frame) < nsymbols * sps:
+        return None
+    peaks = frame[:len(preamble) * sps].reshape(len(preamble), sps).max(1)
+    # threshold halfway between the preamble's ones and zeros
+    one, zero = peaks[preamble == 1].mean(), peaks[preamble == 0].mean()
+    symbols = slice_symbols(frame, sps, 0.5 * (one + zero), one - zero)
+    return symbols.bits[len(preamble):]
+
+def decode_range(path, start, stop, params):
+    '''
+    frames whose preamble starts in samples start..stop of the capture at
+    path; runs in a worker process
+    '''
+    D = params.decimation
+    channel_filter = ChannelFilter(D, params.sample_rate, params.offset_hz)
+    length = frame_samples(params)
+    with CaptureReader(path, params.sample_rate) as capture:
+        first = max(start - len(channel_filter.taps), 0)
+        # whole decimated samples from the capture start
+        first -= first % D
+        last = min(stop + length + len(channel_filter.taps), len(capture))
+        parts = [channel_filter.process(chunk)
+                 for chunk in capture.chunks(first, last)]
+    parts.append(channel_filter.flush())
+    filtered = np.concatenate(parts)
+    rate = params.sample_rate / D
+    envelope = smooth(np.abs(filtered),
+                      max(int(SMOOTH_MS * rate / 1000), 1))
+
+    preamble = as_bits(BARKER_13)
+    template = preamble_template(rate, params.symbol_period_ms,
+                                 params.burst_ms, preamble)
+    correlator = PreambleCorrelator(template, params.threshold)
+    detections = correlator.process(np.abs(filtered)) + correlator.flush()
+
+    sps = int(round(params.symbol_period_ms * rate / 1000))
+    nsymbols = len(preamble) + payload_symbols(params)
+    frames = []
+    for detection in detections:
+        sample = first + detection.sample * D
+        if not start <= sample < stop:
+            continue
+        bits = _frame_bits(envelope, detection.sample, sps, preamble,
+                           nsymbols)
+        if bits is None:
+            continue
+        payload, corrected = None, 0
+        if params.fec_depth:
+            payload, corrected = fec.decode_payload(bits, params.nbytes,
+                                                    params.fec_depth)
+        else:
+            payload = np.packbits(bits).tobytes()
+        frames.append(DecodedFrame(sample, detection.score, bits, payload,
+                                   corrected))
+    return frames
+
+def merge_frames(frames, tolerance):
+    '''
+    frames sorted by sample, with any two closer than tolerance samples
+    merged into the one with the better score
+    '''
+    merged = []
+    for frame in sorted(frames, key=lambda f: f.sample):
+        if merged and frame.sample - merged[-1].sample < tolerance:
+            if frame.score > merged[-1].score:
+                merged[-1] = frame
+            continue
+        merged.append(frame)
+    return merged
+
+def decode_capture(path, params, workers=None, range_samples=None):
+    '''
+    all frames of the capture at path; workers=1 decodes in this process
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    with CaptureReader(path, params.sample_rate) as capture:
+        num_samples = len(capture)
+    if range_samples is None:
+        range_samples = max(-(-num_samples // (RANGES_PER_WORKER * workers)),
+                            MIN_RANGE_FRAMES * frame_samples(params))
+    ranges = split_ranges(num_samples, range_samples)
+    if workers == 1 or len(ranges) == 1:
+        results = [decode_range(path, start, stop, params)
+                   for start, stop in ranges]
+    else:
+        with ProcessPoolExecutor(min(workers, len(ranges))) as pool:
+            futures = [pool.submit(decode_range, path, start, stop, params)
+                       for start, stop in ranges]
+            results = [future.result() for future in futures]
+    # closer than one symbol can only be the same preamble
+    tolerance = int(params.symbol_period_ms * params.sample_rate / 1000)
+    return merge_frames([f for frames in results for f in frames], tolerance)
+
+def main():
+  parser = argparse.ArgumentParser(description='Decode every frame of a raw uint8 I/Q capture on all cores.')
+  parser.add_argument('capture', help='capture file (rtl_sdr format)')
+  parser.add_argument('-s', '--symbol-ms', type=float, required=True, help='symbol period in ms')
+  parser.add_argument('-n', '--nbytes', type=int, default=1, help='payload bytes per frame (default=%(default)s)')
+  parser.add_argument('-b', '--burst-ms', type=float, default=None, help='burst length in ms (default: whole symbol)')
+  parser.add_argument('--fec-depth', type=int, default=None, help='interleaver depth if the frames use FEC')
+  parser.add_argument('-o', '--offset', type=float, default=0.0, help='signal frequency relative to the capture center in Hz (default=%(default)s)')
+  parser.add_argument('-r', '--rate', type=float, default=SAMPLE_RATE, help='capture sample rate (default=%(default)s)')
+  parser.add_argument('-j', '--workers', type=int, default=None, help='processes (default: one per core)')
+  args = parser.parse_args()
+
+  params = decode_params(args.symbol_ms, args.nbytes, args.burst_ms,
+                         args.fec_depth, args.offset,
+                         sample_rate=args.rate)
+  for frame in decode_capture(args.capture, params, args.workers):
+    print("{:.3f} s  score {:.2f}  {}".format(
+      frame.sample / args.rate, frame.score, frame.payload.hex()))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,144 @@
+'''
+Frame sync: finds the 13 bit barker preamble of modulator.main() in the
+envelope of a capture.
+The preamble is upsampled to the symbol period (a burst of burst_ms at the
+start of every "1" symbol, nothing for a "0"), made zero-mean, and
+cross-correlated with the envelope by FFT using overlap-save, so an
+unbounded stream is processed in fixed-size segments and a preamble
+straddling two blocks is found like any other. The correlation is
+normalized by the envelope's energy under the template, which makes the
+score (-1..1) independent of signal level; every cluster of scores above
+threshold gives one detection at its peak.
+Feed it a decimated envelope (see channel_filter.py): at the full
+1.024 MS/s a preamble is millions of samples long.
+'''
+
+from collections import namedtuple
+
+import numpy as np
+from frame_encoder import BARKER_13
+
+# normalized correlation a preamble has to reach
+THRESHOLD = 0.6
+
+Detection = namedtuple("Detection", ["sample", "score"])
+
+def preamble_template(sample_rate, symbol_period_ms, burst_ms=None,
+                      preamble=BARKER_13):
+    '''
+    zero-mean envelope shape of the preamble at sample_rate
+    '''
+    sps = int(round(symbol_period_ms * sample_rate / 1000))
+    on = sps if burst_ms is None else min(int(round(
+        burst_ms * sample_rate / 1000)), sps)
+    symbol = np.zeros(sps)
+    symbol[:on] = 1
+    template = (np.asarray(preamble, dtype=np.float64)[:, None]
+                * symbol).ravel()
+    return template - template.mean()
+
+class PreambleCorrelator:
+    """
+    Streaming FFT correlator. process() takes envelope blocks of any size
+    and returns the Detections completed so far, with sample counted from
+    the first sample ever given to process() (where the preamble starts).
+
+    """
+    def __init__(self, template, threshold=THRESHOLD, fft_size=None):
+        self.template = np.asarray(template, dtype=np.float64)
+        self.length = L = len(self.template)
+        if fft_size is None:
+            fft_size = 1 << int(np.ceil(np.log2(4 * L)))
+        if fft_size < 2 * L:
+            raise ValueError("fft_size must be at least twice the template")
+        self.fft_size = fft_size
+        # outputs per segment
+        self.step = fft_size - L + 1
+        self.threshold = threshold
+        self.__spectrum = np.conj(np.fft.rfft(self.template, fft_size))
+        self.__norm = np.sqrt(np.sum(self.template ** 2))
+        self.__buffer = np.zeros(0, dtype=np.float64)
+        # absolute index of __buffer[0]
+        self.__position = 0
+        # cluster still open at the end of the last segment
+        self.__open = None
+
+    def correlate(self, segment):
+        '''
+        normalized correlation for the step outputs of one fft_size segment
+        '''
+        L = self.length
+        raw = np.fft.irfft(np.fft.rfft(segment) * self.__spectrum,
+                           self.fft_size)[:self.step]
+        sums = np.concatenate(([0.0], np.cumsum(segment)))
+        squares = np.concatenate(([0.0], np.cumsum(segment * segment)))
+        s = sums[L:L + self.step] - sums[:self.step]
+        s2 = squares[L:L + self.step] - squares[:self.step]
+        energy = np.maximum(s2 - s * s / L, 1e-12)
+        return raw / (self.__norm * np.sqrt(energy))
+
+    def __detect(self, scores, first):
+        found = []
+        above = np.flatnonzero(scores > self.threshold)
+        if len(above):
+            values = scores[above]
+            # a new cluster starts wherever the gap is longer than a preamble
+            starts = np.flatnonzero(np.diff(above) > self.length) + 1
+            ends = np.append(starts, len(above))
+            starts = np.insert(starts, 0, 0)
+            for begin, end in zip(starts, ends):
+                best = begin + int(np.argmax(values[begin:end]))
+                # [best sample, best score, last sample above threshold]
+                cluster = [first + int(above[best]), float(values[best]),
+                           first + int(above[end - 1])]
+                if self.__open is not None:
+                    if first + int(above[begin]) - self.__open[2] <= self.length:
+                        if cluster[1] > self.__open[1]:
+                            self.__open[:2] = cluster[:2]
+                        self.__open[2] = cluster[2]
+                        continue
+                    found.append(Detection(self.__open[0], self.__open[1]))
+                self.__open = cluster
+        # close the open cluster once a whole preamble has passed without
+        # another score above threshold
+        end = first + len(scores)
+        if self.__open is not None and end - self.__open[2] > self.length:
+            found.append(Detection(self.__open[0], self.__open[1]))
+            self.__open = None
+        return found
+
+    def process(self, envelope):
+        self.__buffer = np.concatenate((self.__buffer,
+                                        np.asarray(envelope, np.float64)))
+        found = []
+        while len(self.__buffer) >= self.fft_size:
+            scores = self.correlate(self.__buffer[:self.fft_size])
+            found += self.__detect(scores, self.__position)
+            # overlap-save: keep the L - 1 samples the next outputs need
+            self.__buffer = self.__buffer[self.step:]
+            self.__position += self.step
+        return found
+
+    def flush(self):
+        '''
+        detections still pending at the end of a stream
+        '''
+        remaining = len(self.__buffer) - self.length + 1
+        found = []
+        if remaining > 0:
+            segment = np.zeros(self.fft_size)
+            segment[:len(self.__buffer)] = self.__buffer
+            scores = self.correlate(segment)[:remaining]
+            found = self.__detect(scores, self.__position)
+        if self.__open is not None:
+            found.append(Detection(self.__open[0], self.__open[1]))
+            self.__open = None
+        self.__buffer = self.__buffer[:0]
+        return found
+
+def find_preambles(envelope, template, threshold=THRESHOLD):
+    '''
+    all preambles in a whole (decimated) envelope
+    '''
+    correlator = PreambleCorrelator(template, threshold)
+    return correlator.process(envelope) + correlator.flush()
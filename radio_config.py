@@ -0,0 +1,46 @@
+'''
+Receiver settings shared by everything that tunes the RTL-SDR or works on
+its captures, so the center frequency and sample rate are set in one
+place. Kept apart from sdr.py so modules that only handle capture files
+don't need the rtlsdr package.
+A frequency sweep (SdrReceiver.sweep, auto_tune.py) saves what it found to
+CONFIG_PATH; FREQUENCY and SAMPLE_RATE below come from there when it
+exists, so the next run is tuned to the sensor without editing anything.
+'''
+
+import json
+import os
+import time
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "receiver_config.json")
+
+# where the fingerprint sensor radiates when nothing has been swept yet
+DEFAULT_FREQUENCY = 125.8e6
+
+# samples per second; bursts are tens of ms, so this is plenty
+DEFAULT_SAMPLE_RATE = 1.024e6
+
+def load_config(path=CONFIG_PATH):
+    '''
+    returns the saved config, or {} if nothing has been saved
+    '''
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_config(path=CONFIG_PATH, **settings):
+    '''
+    updates the saved config with settings (frequency=..., ...)
+    '''
+    config = load_config(path)
+    config.update(settings)
+    config["updated"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    with open(path, "w") as f:
+        json.dump(config, f, indent=2)
+    return config
+
+config = load_config()
+FREQUENCY = float(config.get("frequency", DEFAULT_FREQUENCY))
+SAMPLE_RATE = float(config.get("sample_rate", DEFAULT_SAMPLE_RATE))
@@ -0,0 +1,268 @@
+'''
+Records long receive sessions to disk as raw uint8 I/Q, the format
+rtl_sdr writes and capture_reader.py reads.
+The librtlsdr callback only copies each buffer into a free slot of a
+preallocated pool and queues it; a dedicated writer thread writes the
+slots out unconverted and hands them back, so USB transfers are never
+held up by the disk. If the writer ever falls a whole pool behind, the
+block is dropped and counted rather than stalling the dongle.
+Data goes to numbered files of file_samples each, <prefix>_0000.bin,
+<prefix>_0001.bin, ..., next to <prefix>.json (sample rate, center
+frequency, ...) and <prefix>.index, one INDEX_DTYPE record per block:
+when it started, which sample of the session it is, and where it is on
+disk. CaptureIndex uses it to find any time range without scanning the
+data. Both are flushed whenever the writer has caught up, so a recording
+can be read while it is still running.
+'''
+
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+from iq_samples import bytes_to_iq
+from radio_config import FREQUENCY, SAMPLE_RATE
+
+# samples per USB buffer (librtlsdr wants a multiple of 256 bytes)
+BLOCK_SIZE = 256 * 1024
+
+# blocks the writer may fall behind; 32 MB at the default block size
+POOL_BLOCKS = 64
+
+# 10 minutes per file at SAMPLE_RATE
+FILE_SAMPLES = int(SAMPLE_RATE * 600)
+
+INDEX_DTYPE = np.dtype([("time_ns", np.int64), # wall clock of the first sample
+                        ("sample", np.int64), # of the whole session
+                        ("file", np.int32),
+                        ("file_sample", np.int64),
+                        ("samples", np.int32)])
+
+class Recorder:
+    """
+    Writer side of a recording. on_buffer() is the librtlsdr async
+    callback; write_block() feeds a block from anything else. Call
+    close() (or use it as a context manager) to flush the queue and the
+    files.
+
+    """
+    def __init__(self, directory, prefix="capture", sample_rate=SAMPLE_RATE,
+                 center_freq=FREQUENCY, block_size=BLOCK_SIZE,
+                 pool_blocks=POOL_BLOCKS, file_samples=FILE_SAMPLES):
+        self.directory = directory
+        self.prefix = prefix
+        self.sample_rate = sample_rate
+        self.center_freq = center_freq
+        self.block_size = block_size
+        self.file_samples = file_samples
+        self.samples = 0
+        self.blocks = 0
+        self.dropped_blocks = 0
+        self.dropped_samples = 0
+        self.files = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self.__pool = np.empty((pool_blocks, 2 * block_size), dtype=np.uint8)
+        self.__free = queue.Queue()
+        for slot in range(pool_blocks):
+            self.__free.put(slot)
+        self.__filled = queue.Queue()
+        self.__file = None
+        self.__file_sample = 0
+        self.__index = open(self.path(".index"), "wb")
+        with open(self.path(".json"), "w") as f:
+            json.dump({"sample_rate": sample_rate, "center_freq": center_freq,
+                       "block_size": block_size,
+                       "file_samples": file_samples,
+                       "format": "uint8 interleaved I/Q",
+                       "started_ns": time.time_ns()}, f)
+        self.__writer = threading.Thread(target=self.__run, name="recorder",
+                                         daemon=True)
+        self.__writer.start()
+
+    def path(self, suffix):
+        return os.path.join(self.directory, self.prefix + suffix)
+
+    def write_block(self, raw, time_ns=None):
+        '''
+        queues one block of interleaved I/Q bytes; time_ns is when its
+        last sample arrived (now if not given). Returns False if it had to
+        be dropped.
+        '''
+        if time_ns is None:
+            time_ns = time.time_ns()
+        try:
+            slot = self.__free.get_nowait()
+        except queue.Empty:
+            self.dropped_blocks += 1
+            self.dropped_samples += len(raw) // 2
+            return False
+        n = min(len(raw), self.__pool.shape[1])
+        self.__pool[slot, :n] = np.frombuffer(raw, dtype=np.uint8, count=n)
+        self.__filled.put((slot, n, time_ns))
+        return True
+
+    def on_buffer(self, buffer, context):
+        self.write_block(buffer)
+
+    def __rotate(self):
+        if self.__file is not None:
+            self.__file.close()
+        self.__file = open(self.path("_{:04d}.bin".format(self.files)),
+                           "wb")
+        self.__file_sample = 0
+        self.files += 1
+
+    def __run(self):
+        record = np.zeros(1, dtype=INDEX_DTYPE)
+        while True:
+            item = self.__filled.get()
+            if item is None:
+                break
+            slot, n, time_ns = item
+            if self.__file is None or self.__file_sample >= self.file_samples:
+                self.__rotate()
+            samples = n // 2
+            record[0] = (time_ns - int(samples / self.sample_rate * 1e9),
+                         self.samples, self.files - 1, self.__file_sample,
+                         samples)
+            # straight from the pool slot, no conversion
+            self.__file.write(memoryview(self.__pool[slot, :n]))
+            self.__index.write(record.tobytes())
+            self.__free.put(slot)
+            self.__file_sample += samples
+            self.samples += samples
+            self.blocks += 1
+            if self.__filled.empty():
+                # caught up: make the batch visible to a CaptureIndex on
+                # the running recording, data before the index entries
+                self.__file.flush()
+                self.__index.flush()
+        if self.__file is not None:
+            self.__file.close()
+        self.__index.close()
+
+    def record(self, receiver, duration_s=None):
+        '''
+        records from an SdrReceiver for duration_s seconds, or until
+        KeyboardInterrupt
+        '''
+        sdr = receiver.sdr
+        reader = threading.Thread(
+            target=sdr.read_bytes_async,
+            args=(self.on_buffer, 2 * self.block_size),
+            name="rtlsdr-reader", daemon=True)
+        reader.start()
+        try:
+            reader.join(duration_s)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sdr.cancel_read_async()
+            reader.join()
+
+    def close(self):
+        if self.__writer.is_alive():
+            self.__filled.put(None)
+            self.__writer.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class CaptureIndex:
+    """
+    A finished (or still running) recording, located by its index: which
+    blocks, files and byte offsets hold a given session sample or wall
+    clock time.
+
+    """
+    def __init__(self, directory, prefix="capture"):
+        self.directory = directory
+        self.prefix = prefix
+        with open(os.path.join(directory, prefix + ".json")) as f:
+            self.meta = json.load(f)
+        self.sample_rate = self.meta["sample_rate"]
+        self.index = np.fromfile(os.path.join(directory, prefix + ".index"),
+                                 dtype=INDEX_DTYPE)
+        self.samples = int(self.index["samples"].sum())
+
+    def file_path(self, number):
+        return os.path.join(self.directory,
+                            "{}_{:04d}.bin".format(self.prefix, number))
+
+    def sample_at(self, time_ns):
+        '''
+        session sample recorded at wall clock time_ns (clamped to the
+        recording)
+        '''
+        i = max(np.searchsorted(self.index["time_ns"], time_ns, "right") - 1,
+                0)
+        block = self.index[i]
+        offset = int((time_ns - int(block["time_ns"])) * self.sample_rate
+                     / 1e9)
+        return min(max(int(block["sample"]) + offset, 0), self.samples)
+
+    def locate(self, sample):
+        '''
+        (file number, sample in that file) holding session sample
+        '''
+        i = max(np.searchsorted(self.index["sample"], sample, "right") - 1, 0)
+        block = self.index[i]
+        return (int(block["file"]),
+                int(block["file_sample"]) + sample - int(block["sample"]))
+
+    def read_raw(self, start, stop):
+        '''
+        raw bytes of session samples start..stop, across files if needed
+        '''
+        parts = []
+        while start < stop:
+            number, offset = self.locate(start)
+            data = np.memmap(self.file_path(number), dtype=np.uint8, mode="r")
+            count = min(stop - start, len(data) // 2 - offset)
+            if count <= 0:
+                break
+            parts.append(np.array(data[2 * offset:2 * (offset + count)]))
+            start += count
+        if not parts:
+            return np.zeros(0, dtype=np.uint8)
+        return np.concatenate(parts)
+
+    def read(self, start_ns, stop_ns):
+        '''
+        complex64 samples recorded between two wall clock times
+        '''
+        return bytes_to_iq(self.read_raw(self.sample_at(start_ns),
+                                         self.sample_at(stop_ns)))
+
+def main():
+  from sdr import SdrReceiver
+  parser = argparse.ArgumentParser(description='Record raw I/Q from the RTL-SDR to rotating files with a timestamp index.')
+  parser.add_argument('directory', help='where to put the capture files')
+  parser.add_argument('-p', '--prefix', default='capture', help='file name prefix (default=%(default)s)')
+  parser.add_argument('-f', '--frequency', type=float, default=FREQUENCY, help='center frequency in Hz (default=%(default)s)')
+  parser.add_argument('-r', '--rate', type=float, default=SAMPLE_RATE, help='sample rate (default=%(default)s)')
+  parser.add_argument('-d', '--duration', type=float, default=None, help='seconds to record (default: until Ctrl-C)')
+  parser.add_argument('--file-minutes', type=float, default=10, help='minutes per file (default=%(default)s)')
+  args = parser.parse_args()
+
+  receiver = SdrReceiver(args.frequency, args.rate)
+  recorder = Recorder(args.directory, args.prefix, args.rate, args.frequency,
+                      file_samples=int(args.rate * 60 * args.file_minutes))
+  try:
+    recorder.record(receiver, args.duration)
+  finally:
+    recorder.close()
+    receiver.close()
+  print("{} samples in {} files, {} blocks dropped".format(
+    recorder.samples, recorder.files, recorder.dropped_blocks))
+
+
+if __name__ == '__main__':
+  main()
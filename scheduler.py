@@ -0,0 +1,143 @@
+'''
+Deadline based symbol timing for the OOK transmitter.
+Symbol k of a frame starts at t0 + k * symbol_period on the
+time.monotonic_ns() clock, no matter how long the previous pulse took.
+A "1" is keyed with fm.pulse() and a "0" just waits for the next deadline,
+so the time spent in BSAPI is taken out of the wait instead of adding up
+over the frame. Other line codes hand over their pulse times directly
+(send_schedule).
+'''
+
+import threading
+import time
+
+import numpy as np
+from fprint_codes import ABS_STATUS_OK, ABS_STATUS_TIMEOUT
+from frame_encoder import as_bits
+
+# symbol period used by send_code; the "0" gap of the original modulator
+SYMBOL_PERIOD_MS = 177
+
+# sleep can overshoot by a scheduler tick, so the last stretch before a
+# deadline is spun
+SPIN_NS = 1000000
+
+class TransmitCancelled(Exception):
+    pass
+
+def wait_until(deadline_ns, spin_ns=SPIN_NS, cancelled=None):
+    """
+    Waits for deadline_ns; with a threading.Event as cancelled, returns
+    early with True as soon as it is set.
+
+    """
+    remaining = deadline_ns - time.monotonic_ns()
+    if remaining > spin_ns:
+        if cancelled is None:
+            time.sleep((remaining - spin_ns) / 1e9)
+        elif cancelled.wait((remaining - spin_ns) / 1e9):
+            return True
+    while time.monotonic_ns() < deadline_ns:
+        pass
+    return cancelled is not None and cancelled.is_set()
+
+class SymbolScheduler:
+    """
+    Keys bit sequences on an absolute symbol grid.
+    pulse_ns holds the measured duration of the last pulse and
+    mean_pulse_ns a running average; a pulse that cannot start on its
+    deadline because the previous one overran is counted in late_symbols.
+    The grid itself never moves, so a late symbol does not shift the rest
+    of the frame.
+    With a tracing.SymbolTrace as trace, every pulse is recorded in it.
+    cancel() may be called from any thread: it aborts the grab in progress
+    and the frame being sent raises TransmitCancelled within about a
+    millisecond. reset() makes the scheduler usable again.
+
+    """
+    def __init__(self, fm, symbol_period_ms=SYMBOL_PERIOD_MS,
+                 spin_ns=SPIN_NS, trace=None):
+        self.fm = fm
+        self.trace = trace
+        self.symbol_period_ns = int(symbol_period_ms * 1000000)
+        self.spin_ns = spin_ns
+        self.pulse_ns = 0
+        self.mean_pulse_ns = 0.0
+        self.pulses = 0
+        self.late_symbols = 0
+        self.reanchored = 0
+        self.errors = 0
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+        self.fm.cancel()
+
+    def reset(self):
+        self.cancelled.clear()
+
+    def __wait(self, deadline_ns):
+        if wait_until(deadline_ns, self.spin_ns, self.cancelled):
+            raise TransmitCancelled()
+
+    def min_symbol_period_ms(self):
+        """Shortest period the measured pulses fit in."""
+        return self.mean_pulse_ns / 1000000.0
+
+    def key(self, scheduled_ns=0):
+        start = time.monotonic_ns()
+        status = self.fm.pulse()
+        end = time.monotonic_ns()
+        if self.trace is not None:
+            self.trace.record(scheduled_ns, start, end, status,
+                              getattr(self.fm, "last_message", 0),
+                              getattr(self.fm, "messages", 0))
+        if self.cancelled.is_set():
+            raise TransmitCancelled()
+        self.pulse_ns = end - start
+        self.pulses += 1
+        self.mean_pulse_ns += (self.pulse_ns - self.mean_pulse_ns) / self.pulses
+        if status not in (ABS_STATUS_OK, ABS_STATUS_TIMEOUT):
+            self.errors += 1
+        return status
+
+    def send(self, bits, start_ns=None):
+        """
+        Keys bits as on-off keying with this scheduler's symbol period.
+
+        """
+        bits = as_bits(bits)
+        offsets = np.flatnonzero(bits).astype(np.int64) * self.symbol_period_ns
+        return self.send_schedule(offsets, self.symbol_period_ns * len(bits),
+                                  start_ns)
+
+    def send_schedule(self, offsets_ns, duration_ns, start_ns=None):
+        """
+        Keys one pulse at start_ns + each offset (see line_codes.py),
+        waits out the rest of the frame and returns the time it ends.
+        start_ns defaults to one spin window from now; a start_ns already
+        in the past is moved there too (counted in reanchored).
+
+        """
+        if self.cancelled.is_set():
+            raise TransmitCancelled()
+        now = time.monotonic_ns()
+        if start_ns is None:
+            start_ns = now + self.spin_ns
+        elif start_ns < now:
+            # a start that has already passed would make every pulse late
+            # and key the frame back to back; start the grid now instead
+            start_ns = now + self.spin_ns
+            self.reanchored += 1
+        deadlines = start_ns + np.asarray(offsets_ns, dtype=np.int64)
+
+        for deadline in deadlines.tolist():
+            if time.monotonic_ns() > deadline + self.spin_ns:
+                # the previous pulse ran into this one's slot
+                self.late_symbols += 1
+            else:
+                self.__wait(deadline)
+            self.key(deadline)
+        end_ns = start_ns + duration_ns
+        self.__wait(end_ns)
+        return end_ns
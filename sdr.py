@@ -6,20 +6,37 @@
 
 
 from rtlsdr import * # RtlSdr library
+import queue
+import threading
 import time
 import matplotlib.pyplot as plt
 import numpy as np
+from iq_samples import bytes_to_iq
+from capture_reader import CaptureReader
+from fast_plot import plot_samples
+from radio_config import FREQUENCY, SAMPLE_RATE, save_config
+from spectrogram import NFFT, mean_spectrum, rank_peaks, to_db
 
 # Change these as you like.
 NUM_BITS = 256*1024 # Number of bits to be read from sdr (minimum is 256)
-SAMPLE_RATE = 1.024e6
-FREQUENCY = 100e6
+# SAMPLE_RATE and FREQUENCY live in radio_config.py
+
+# sweep: samples thrown away after each retune, and the fraction of each
+# step's band that is used (the edges roll off); bins this close to the
+# center hold the dongle's DC spike
+SWEEP_SETTLE_MS = 5
+SWEEP_DWELL_MS = 20
+# shortest keyed dwell, longer than one burst (40 ms at the least), so a
+# keyed step always holds sensor emission
+SWEEP_KEYED_DWELL_MS = 100
+SWEEP_USABLE = 0.8
+DC_BINS = 2
 
 # PRE:  Takes in RtlSdr object and sampling array
 # POST: Graphs the amplitude over time with given values
 
 def main():
-    sdr_read_samples(1024, 125800000, 300e3)
+    sdr_read_samples(1024, FREQUENCY, 300e3)
 
 # def graph_amp_over_time(sample_amplitudes, delta):
 #     import matplotlib.pyplot as plt
@@ -36,44 +53,206 @@ def main():
 #     plt.ylabel('amplitude')
 #     plt.show()
 
+class SdrReceiver:
+    """
+    One open RtlSdr, tuned once and read many times.
+    blocks() streams fixed-size blocks through librtlsdr's async API:
+    buffer_count USB transfers are kept in flight, and a reader thread
+    hands blocks to the generator through a queue of queue_depth blocks.
+    When the consumer falls behind, blocks that do not fit are dropped and
+    counted in dropped_samples instead of stalling the USB transfers.
+
+    """
+    def __init__(self, center_freq=FREQUENCY, sample_rate=SAMPLE_RATE,
+                 gain='auto', buffer_count=15, device_index=0):
+        self.sdr = RtlSdr(device_index)
+        self.sdr.rs = sample_rate
+        self.sdr.fc = center_freq
+        self.sdr.gain = gain
+        # number of async USB buffers librtlsdr keeps queued
+        self.sdr.DEFAULT_ASYNC_BUF_NUMBER = buffer_count
+        self.center_freq = center_freq
+        self.sample_rate = sample_rate
+        self.dropped_samples = 0
+        self.received_samples = 0
+
+    def tune(self, center_freq=None, sample_rate=None):
+        # only touch the tuner when something changes
+        if center_freq is not None and center_freq != self.center_freq:
+            self.sdr.fc = self.center_freq = center_freq
+        if sample_rate is not None and sample_rate != self.sample_rate:
+            self.sdr.rs = self.sample_rate = sample_rate
+
+    def read(self, num_samples):
+        return bytes_to_iq(self.read_bytes(num_samples))
+
+    def read_bytes(self, num_samples):
+        # read_bytes hands back librtlsdr's reused buffer
+        return np.frombuffer(self.sdr.read_bytes(2 * num_samples),
+                             dtype=np.uint8).copy()
+
+    def raw_blocks(self, block_size=NUM_BITS, num_blocks=None,
+                   queue_depth=64):
+        """
+        Yields uint8 arrays of 2 * block_size interleaved I/Q bytes,
+        num_blocks of them or until the generator is closed.
+
+        """
+        blocks = queue.Queue(queue_depth)
+        done = object()
+        stopping = threading.Event()
+
+        def callback(buffer, context):
+            data = np.frombuffer(buffer, dtype=np.uint8).copy()
+            self.received_samples += len(data) // 2
+            try:
+                blocks.put_nowait(data)
+            except queue.Full:
+                self.dropped_samples += len(data) // 2
+
+        def run():
+            try:
+                self.sdr.read_bytes_async(callback, 2 * block_size)
+            finally:
+                # nobody reads the queue any more once the generator is
+                # being closed
+                if not stopping.is_set():
+                    blocks.put(done)
+
+        reader = threading.Thread(target=run, name="rtlsdr-reader",
+                                  daemon=True)
+        reader.start()
+        try:
+            count = 0
+            while num_blocks is None or count < num_blocks:
+                data = blocks.get()
+                if data is done:
+                    break
+                yield data
+                count += 1
+        finally:
+            stopping.set()
+            self.sdr.cancel_read_async()
+            reader.join()
+
+    def blocks(self, block_size=NUM_BITS, num_blocks=None, queue_depth=64):
+        """
+        Same as raw_blocks, converted to complex64 samples.
+
+        """
+        for data in self.raw_blocks(block_size, num_blocks, queue_depth):
+            yield bytes_to_iq(data)
+
+    def sweep(self, start_hz, stop_hz, dwell_ms=SWEEP_DWELL_MS,
+              settle_ms=SWEEP_SETTLE_MS, nfft=NFFT, keyer=None, count=5,
+              save=True):
+        """
+        Steps the tuner across start_hz..stop_hz and returns the count
+        strongest candidate frequencies (spectrogram.Candidate), best
+        first. Without a keyer, bins are ranked by how far they stand
+        above the median bin. With one (anything with start() and stop(),
+        e.g. auto_tune.PulseKeyer), each step is measured once idle and
+        once while the keyer runs, and bins are ranked by how much the
+        keying raised them, which picks out the sensor from other
+        transmitters. The keyed dwell starts once keyer.start() has
+        returned (PulseKeyer waits for its first pulse to begin) and the
+        samples buffered before it are dropped, and lasts at least
+        SWEEP_KEYED_DWELL_MS. With save, the best frequency goes into
+        radio_config's receiver_config.json and the receiver stays tuned
+        to it; the sample rate used for the sweep is not saved, since
+        SAMPLE_RATE is also what capture files are read at.
+
+        """
+        rate = self.sample_rate
+        step = rate * SWEEP_USABLE
+        previous = self.center_freq
+        num_samples = int(dwell_ms * rate / 1000)
+        keyed_samples = int(max(dwell_ms, SWEEP_KEYED_DWELL_MS) * rate / 1000)
+        settle = int(settle_ms * rate / 1000)
+        freqs, idle, keyed = [], [], []
+        for center in np.arange(start_hz + step / 2, stop_hz + step / 2,
+                                step):
+            self.tune(center)
+            # stale samples from before the retune
+            self.sdr.read_bytes(2 * settle)
+            f, power = mean_spectrum(self.read(num_samples), nfft, rate,
+                                     center)
+            offset = np.abs(f - center)
+            keep = (offset <= step / 2) & (offset > DC_BINS * rate / nfft)
+            freqs.append(f[keep])
+            idle.append(power[keep])
+            if keyer is not None:
+                keyer.start()
+                try:
+                    # samples from before the keying
+                    self.sdr.read_bytes(2 * settle)
+                    power = mean_spectrum(self.read(keyed_samples), nfft,
+                                          rate, center)[1]
+                finally:
+                    keyer.stop()
+                keyed.append(power[keep])
+        freqs = np.concatenate(freqs)
+        idle_db = to_db(np.concatenate(idle))
+        if keyer is not None:
+            power_db = to_db(np.concatenate(keyed))
+            score = power_db - idle_db
+        else:
+            power_db = idle_db
+            score = idle_db - np.median(idle_db)
+        # one candidate per emission, not one per bin of it
+        candidates = rank_peaks(freqs, score, power_db, count,
+                                min_separation=10 * rate / nfft)
+        if save and candidates:
+            best = candidates[0].frequency
+            save_config(frequency=best, sweep=[start_hz, stop_hz])
+            self.tune(best)
+        else:
+            self.tune(previous)
+        return candidates
+
+    def close(self):
+        self.sdr.close()
+
+# receivers opened by sdr_read_samples, by device index
+receivers = {}
+
+def get_receiver(center_freq=FREQUENCY, sample_rate=SAMPLE_RATE,
+                 device_index=0):
+    receiver = receivers.get(device_index)
+    if receiver is None:
+        receiver = receivers[device_index] = SdrReceiver(
+            center_freq, sample_rate, device_index=device_index)
+    else:
+        receiver.tune(center_freq, sample_rate)
+    return receiver
+
 '''
 Num_of_samples should be power of 2!
 '''
 # TODO: change function to get multiplication of sample_rate as Num_of_samples
 def sdr_read_samples(Num_of_samples, center_freq, sample_rate):
-	# setup RtlSdr object
-	sdr = RtlSdr()
-	# set rate, freq
-	sdr.rs = sample_rate
-	sdr.fc = center_freq
-	samples = sdr.read_samples(Num_of_samples)
+	# the device stays open between calls; see get_receiver
+	receiver = get_receiver(center_freq, sample_rate)
+	samples = receiver.read(Num_of_samples)
 	# measure time in ms
 	time = (Num_of_samples/sample_rate)*1000
 	return(samples, time)
 	
 def sdr_time_domain_plot(yData, time):
-    plt.figure()
-    #print time/len(yData)
-    t = np.arange(0.0, time, time/(len(yData))) # from zero up to delta with
-                                                             # delta/len(sampleAmplitudes) number of data points
-    s = yData
-    plt.plot(t, s)
-    plt.title('Amplitude')
-    plt.xlabel('time (ms)')
-    plt.ylabel('amplitude')
+    # reduced to a min/max per pixel column first; see fast_plot.py
+    plot_samples(yData, time)
     plt.show()
 	
 '''
 read data from binary file with uint8 format
-returns samples in iq format
+returns samples in iq format (complex64)
+for captures too big for memory use capture_reader.CaptureReader
 '''
 def sdr_read_file(address):
-	f = open(address, 'r')
-	data = np.fromfile(f, dtype=np.uint8)
-	iq_output = (data[0::2]/(255.0/2.0)-1) + (1j*(data[1::2]/(255.0/2.0)-1))
-	#iq_output = (data[0::2]) + 1j*(data[1::2])
-	f.close()
-	return iq_output
+	# memory mapped and converted through IQ_LUT in one pass, no float64
+	# temporaries
+	with CaptureReader(address) as capture:
+		return capture.read(out=np.empty(len(capture), dtype=np.complex64))
 		
 if __name__ == '__main__':
     main()
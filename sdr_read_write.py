@@ -1,119 +1,161 @@
 import threading
-from collections import deque
 from threading import Thread
-from Queue import Queue
-from rtlsdr import *
 import matplotlib.pyplot as plt
 import numpy as np
+from fast_plot import LivePlot, MinMaxAccumulator, plot_envelope
+from iq_samples import bytes_to_iq
+from radio_config import FREQUENCY, SAMPLE_RATE
+from sdr import SdrReceiver
+
+# ring sizes; change Num_of_samples to what ever you like per window
+NUM_BLOCKS = 1000
+BLOCK_SIZE = 256*13
+
+# what write() does when the reader is a whole ring behind
+BLOCK = "block" # wait for the reader
+DROP = "drop" # drop the new block and count it
+
+class SampleRing():
+	'''
+	Fixed ring of preallocated complex64 blocks shared by one writer and
+	one reader. The writer fills a slot in place and commits it, the
+	reader gets a view of the oldest filled slot and releases it when
+	done; both sleep on a condition variable instead of spinning.
+	overflows counts the times the writer found the ring full, and
+	dropped_blocks the blocks lost to it under the DROP policy.
+	'''
+
+	def __init__(self, num_blocks=NUM_BLOCKS, block_size=BLOCK_SIZE, policy=BLOCK):
+		self.blocks = np.zeros((num_blocks, block_size), dtype=np.complex64)
+		self.lengths = np.zeros(num_blocks, dtype=np.int64)
+		self.times = np.zeros(num_blocks) # ms covered by each block
+		self.num_blocks = num_blocks
+		self.policy = policy
+		self.head = 0 # blocks committed
+		self.tail = 0 # blocks released
+		self.overflows = 0
+		self.dropped_blocks = 0
+		self.closed = False
+		self.cond = threading.Condition()
+
+	def acquire(self):
+		# index of the slot to write next, or None if it had to be dropped
+		with self.cond:
+			if self.head - self.tail == self.num_blocks:
+				self.overflows += 1
+				if self.policy == DROP:
+					self.dropped_blocks += 1
+					return None
+				while self.head - self.tail == self.num_blocks and not self.closed:
+					self.cond.wait()
+			return self.head % self.num_blocks
+
+	def commit(self, length, time):
+		with self.cond:
+			slot = self.head % self.num_blocks
+			self.lengths[slot] = length
+			self.times[slot] = time
+			self.head += 1
+			self.cond.notify_all()
+
+	def write(self, samples, time):
+		slot = self.acquire()
+		if slot is None:
+			return False
+		self.blocks[slot, :len(samples)] = samples
+		self.commit(len(samples), time)
+		return True
+
+	def read(self):
+		# (samples, time) of the oldest block, without copying; None once
+		# the ring is closed and empty. Call release() when done with it.
+		with self.cond:
+			while self.head == self.tail and not self.closed:
+				self.cond.wait()
+			if self.head == self.tail:
+				return None
+			slot = self.tail % self.num_blocks
+			return (self.blocks[slot, :self.lengths[slot]], self.times[slot])
+
+	def release(self):
+		with self.cond:
+			self.tail += 1
+			self.cond.notify_all()
+
+	def close(self):
+		with self.cond:
+			self.closed = True
+			self.cond.notify_all()
+
+# built by main(), so importing this module allocates nothing
+ring = None
+t_prev = 0
 
-# python doesn't have a linked list, so I made my own
-class Buffer_Node():
-
-	# each node has a data field (for the deque)
-	# next field
-	data = None
-	next = None
-
-	def __init__ (self):
-		pass
 
-	def is_empty(self):
-		return self.data == None
+def main():
+	global ring
+	ring = SampleRing(NUM_BLOCKS, BLOCK_SIZE)
 
-data_buffer = Buffer_Node()
-write_pointer = data_buffer # pointers in the circular linked list
-read_pointer = data_buffer # ''
-front = data_buffer
-done = False
-t_prev = 0
 
-delay = True
+def write(num_windows=NUM_BLOCKS):
 
+	receiver = SdrReceiver(center_freq=FREQUENCY, sample_rate=SAMPLE_RATE) # see radio_config.py
+	time = (BLOCK_SIZE/receiver.sample_rate)*1000 # ms per window
 
-def main():
-	global data_buffer, front
-	constructor_pointer = data_buffer
-
-	# initializes linked list
-	for i in range(999): # total of 1000
-		constructor_pointer.next = Buffer_Node()
-		constructor_pointer = constructor_pointer.next
-	constructor_pointer.next = front # to make the linked list circular
-	
-
-def write():
-	
-	sdr = RtlSdr()
-	sdr.rs = 1.024e6 # sampling rate
-	sdr.fc = 1e6 # center freq
-
-	global write_pointer, done, delay
 	i = 0
-	while (True):
-	#for i in range(100):
-		if (i == 2):
-			delay = False
-		write_window = (sdr_read_samples(Num_of_samples=256*13, sdr_object = sdr))
-		# change Num_of_samples to what ever you like per window
-		if (write_pointer.data == None):
-			write_pointer.data = write_window
-		else:
+	try:
+		# blocks stream back to back; each one is converted straight into
+		# its slot in the ring
+		for raw in receiver.raw_blocks(BLOCK_SIZE, num_windows):
+			slot = ring.acquire()
+			if slot is None:
+				continue
+			bytes_to_iq(raw, out=ring.blocks[slot])
+			ring.commit(len(raw) // 2, time)
+			i += 1
+	finally:
+		ring.close()
+		receiver.close()
+	print (i) # prints number of windows written
+	print ('overflows: {}, dropped: {}, dropped by the dongle reader: {}'.format(
+		ring.overflows, ring.dropped_blocks, receiver.dropped_samples))
+
+
+def read(live=False):
+
+	global t_prev
+	# the whole run is reduced to a min/max per pixel column as it arrives
+	# and drawn once at the end; live=True also scrolls the last second
+	accumulator = MinMaxAccumulator()
+	plot = LivePlot(1000, SAMPLE_RATE) if live else None
+	amplitude = np.empty(BLOCK_SIZE, dtype=np.float32)
+	start = None
+	while True:
+		# waits for the writer; None once it is done and everything is read
+		window = ring.read()
+		if window is None:
 			break
-		write_pointer = write_pointer.next
-		i += 1
-	print ('ERROR')
-	print (i) # prints number writing windows created before the ERROR
-	done = True
-	
-
-def read():
-	
-	global read_pointer, done, t_prev
-	plt.figure()
-	plt.title('Amplitude')
-	plt.xlabel('time (ms)')
-	plt.ylabel('amplitude')
-	#plt.show()
-	while not(done):
-		# if for some reason reading is faster than writing, then wait
-		while (read_pointer.data == None):
-			
-			print("nothing to read")
-		time = read_pointer.data[1]
-		sample = np.absolute(read_pointer.data[0])
-		plt.plot((np.arange(0.0 + t_prev, time + t_prev, time/(len(sample)))), sample)
-		# read_pointer.data[0] # array of values
+		samples, time = window
+		if start is None:
+			start, bin_ms = t_prev, time / len(samples)
+		sample = np.absolute(samples, out=amplitude[:len(samples)])
+		accumulator.add(sample)
+		if plot is not None:
+			plot.update(sample)
 		t_prev += time
-		read_pointer.data = None
-		read_pointer = read_pointer.next
-	# done writing, so just read the rest of the values.
-	if (done):
-		while not(read_pointer.data == None):
-			time = read_pointer.data[1]
-			sample = np.absolute(read_pointer.data[0])
-			plt.plot((np.arange(0.0 + t_prev, time + t_prev, time/(len(sample)))), sample)
-			t_prev += time
-			read_pointer.data = None
-			read_pointer = read_pointer.next
+		ring.release()
+	if start is None:
+		return
+	low, high = accumulator.envelope()
+	plot_envelope(low, high, bin_ms * accumulator.bin_size, start)
 	# display the graph
 	plt.show()
 
-# From sdr.py
-def sdr_read_samples(Num_of_samples, sdr_object):
-	samples = sdr_object.read_samples(Num_of_samples)
-	# measure time in ms
-	time = (Num_of_samples/sdr_object.rs)*1000
-	return(samples, time)
-
 
 if __name__ == '__main__':
-	global delay
 	main()
-	
+
 	print ('done initializing')
 
 	Thread(target = write).start() # start writing thread first
-	while(delay):
-		pass
 	Thread(target = read).start() # start reading thread
-	
\ No newline at end of file
@@ -5,7 +5,9 @@ import argparse
 import time
 
 import numpy as np
-from fprint_codes import check_call, callback_message
+from fprint_codes import check_call, callback_message, ABS_STATUS_TIMEOUT
+from frame_encoder import as_bits, bytes_to_bits
+from tracing import SymbolTrace
 
 delay="""
 delay | ms  \n
@@ -60,6 +62,24 @@ def bsapi_callback(operation_param, message, data):
       print('error')
     return message
 
+class CALLBACK_STATE(Structure):
+    # what the pulse callback saw; the pulse operation's context points here
+    _fields_ = [("last_message", c_uint),
+                ("messages", c_uint)]
+
+def pulse_callback(operation_param, message, data):
+    # records instead of printing in the symbol loop; a plain function
+    # writing through the operation's context, so the thunk keeps no
+    # reference to the FMDevice and del fm still closes the session
+    state = cast(operation_param.contents.context,
+                 POINTER(CALLBACK_STATE)).contents
+    state.last_message = message
+    state.messages += 1
+    return message
+
+# one thunk shared by every session; it lives as long as the module
+PULSE_CALLBACK = CALLBACKFUNC(pulse_callback)
+
 class FMDevice:
     """
     Connection to a Fingerprint Module (FM) using the UPEK Biometric
@@ -82,7 +102,46 @@ class FMDevice:
         check_call(self.__bsapi.ABSOpen(b"usb",
                                         byref(self.__conn_handle)))
         self.image_format = self.__get_image_format()
-
+        self.__prepare_pulse()
+
+
+    def __prepare_pulse(self):
+        # everything test() needs is built once per session so the symbol
+        # loop only makes the foreign call
+        self.__grab = self.__bsapi.ABSGrabImage
+        self.__grab.argtypes = [c_int, # connection handle
+                                POINTER(ABS_OPERATION),
+                                c_uint, # purpose
+                                POINTER(ABS_IMAGE_FORMAT),
+                                POINTER(POINTER(ABS_IMAGE)),
+                                c_void_p, # swipe info
+                                c_void_p, # reserved
+                                c_uint] # flags
+        self.__grab.restype = c_int
+
+        # the callback records the messages of each pulse into __state
+        self.__state = CALLBACK_STATE()
+        self.__operation = ABS_OPERATION(
+            0, # operation ID; doesn't matter
+            addressof(self.__state), # data to pass to callback
+            PULSE_CALLBACK,
+            self.timeout, # timeout
+            0x1) # callback flag (nowait)
+        self.__image = POINTER(ABS_IMAGE)()
+        self.__pulse_args = (self.__conn_handle,
+                             byref(self.__operation),
+                             0, # ABS_PURPOSE_UNDEFINED
+                             byref(self.image_format),
+                             byref(self.__image),
+                             None, None, 0)
+
+    @property
+    def last_message(self):
+        return self.__state.last_message
+
+    @property
+    def messages(self):
+        return self.__state.messages
 
     def __get_image_format(self):
         num_formats = c_uint()
@@ -145,23 +204,20 @@ class FMDevice:
 
        #return image
 
-    def test(self):
+    def pulse(self):
+        """
+        Key one burst using the operation prepared in __init__ and return
+        the BSAPI status. A timeout is the expected outcome of a pulse.
 
-        operation_parameters = ABS_OPERATION(
-            0, # operation ID; doesn't matter
-            None, # data to pass to callback
-            CALLBACKFUNC(bsapi_callback),
-            self.timeout, # timeout
-            0x1) # callback flag (nowait)
-
-        image = POINTER(ABS_IMAGE)()
+        """
+        self.__state.messages = 0
+        return self.__grab(*self.__pulse_args)
 
-        check_call(self.__bsapi.ABSGrabImage(self.__conn_handle,
-            byref(operation_parameters), 0, # ABS_PURPOSE_UNDEFINED
-            byref(self.image_format), byref(image), # what we want!
-            None, # swipe info, if desired
-            None, # reserved
-            0)) # flags
+    def test(self):
+        status = self.pulse()
+        if status != ABS_STATUS_TIMEOUT:
+            check_call(status)
+        return status
 
     def __del__(self):
         if self.__conn_handle.value:
@@ -198,22 +254,22 @@ def main():
     send_byte(string=binary_code, fm=fm)
   print("preamble done")
   send_payload(fm)
+  print(trace.summary())
 
 def uint8_to_binary(uint8):
-  bin_val = bin(uint8)
-  binary_code = ""
-  for x in range(8 - (len(bin_val) - 2)):
-    binary_code += "0"
-  for x in range(len(bin_val) - 2):
-    binary_code += bin_val[x + 2]
-  return binary_code
+  return bytes_to_bits(uint8)
+
+# pulse timings, recorded instead of printed so printing doesn't disturb
+# what is being measured; see tracing.py
+trace = SymbolTrace()
 
 def send_byte(string, fm):
-  for i in range(8):
-    if (string[i] == "1"):
-      millis = (int)(round(time.time() * 1000))
+  for bit in as_bits(string):
+    if bit:
+      start = time.monotonic_ns()
+      status = 0
       try:
-        fm.test()
+        status = fm.test()
       except KeyboardInterrupt:
         del fm
         quit()
@@ -222,8 +278,8 @@ def send_byte(string, fm):
         #print("1")
       # if 50:
       #   time.sleep(100.0/1000.0)
-      millis2 = (int)(round(time.time() * 1000))
-      print(str(millis2 - millis))
+      trace.record(start, start, time.monotonic_ns(), status,
+                   fm.last_message, fm.messages)
     else:
       time.sleep(90/1000.0)
       #print("0")
@@ -233,8 +289,9 @@ def send_byte(string, fm):
 def send_payload(fm):
   payload_data = [44, 55, 66, 77]
   payload = np.array(payload_data, dtype="uint8")
+  bits = uint8_to_binary(payload)
   for x in range(payload.size):
-    send_byte(uint8_to_binary(payload[x]), fm)
+    send_byte(bits[8*x:8*x + 8], fm)
 
 
 
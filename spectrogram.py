@@ -0,0 +1,214 @@
+'''
+Spectrogram (waterfall) of a capture, to see which frequency the sensor
+radiates on.
+Frames of nfft samples, hop = nfft * (1 - overlap) apart, are windowed and
+transformed all at once per block (a strided view of the block, one batched
+np.fft.fft), and every `average` consecutive power spectra are averaged
+into one row. Spectrogram carries the samples of a frame that straddles
+two blocks, so a stream gives the same rows in any block sizes.
+capture_spectrogram() runs a whole capture file through it in chunks and
+keeps the result in CACHE_DIR (next to this file) as .npz, keyed by the
+capture's path, size and modification time and by the parameters, so
+looking at the same capture again is a file load.
+'''
+
+import argparse
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+import matplotlib.pyplot as plt
+import numpy as np
+from capture_reader import CaptureReader
+from radio_config import FREQUENCY, SAMPLE_RATE
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         "spectrogram_cache")
+
+# FFT size; 1 kHz bins at SAMPLE_RATE
+NFFT = 1024
+
+# fraction of each frame shared with the next one
+OVERLAP = 0.5
+
+# power spectra averaged into one row
+AVERAGE = 16
+
+SpectrogramResult = namedtuple("SpectrogramResult",
+                               ["power", "freqs", "times"])
+
+Candidate = namedtuple("Candidate", ["frequency", "score_db", "power_db"])
+
+def to_db(power):
+    return 10 * np.log10(np.maximum(power, 1e-20))
+
+class Spectrogram:
+    """
+    Streaming STFT. process() takes complex blocks and returns the rows
+    (averaged power spectra, fftshifted so frequency rises left to right)
+    they complete; row r covers frames r * average .. r * average +
+    average - 1.
+
+    """
+    def __init__(self, nfft=NFFT, overlap=OVERLAP, average=AVERAGE,
+                 sample_rate=SAMPLE_RATE, center_freq=FREQUENCY):
+        self.nfft = nfft
+        self.hop = max(int(round(nfft * (1 - overlap))), 1)
+        self.average = average
+        self.sample_rate = sample_rate
+        self.center_freq = center_freq
+        self.window = np.hanning(nfft).astype(np.float32)
+        # window power, so averaged rows are in power per bin
+        self.__scale = 1.0 / float(np.sum(self.window ** 2))
+        self.__tail = np.zeros(0, dtype=np.complex64)
+        self.__pending = np.zeros((0, nfft), dtype=np.float32)
+
+    @property
+    def freqs(self):
+        return self.center_freq + np.fft.fftshift(
+            np.fft.fftfreq(self.nfft, 1 / self.sample_rate))
+
+    @property
+    def row_seconds(self):
+        return self.hop * self.average / self.sample_rate
+
+    def frames(self, data):
+        '''
+        power spectra of every whole frame in data
+        '''
+        count = (len(data) - self.nfft) // self.hop + 1
+        if count <= 0:
+            return np.zeros((0, self.nfft), dtype=np.float32)
+        frames = np.lib.stride_tricks.sliding_window_view(
+            data, self.nfft)[::self.hop][:count]
+        spectra = np.fft.fft(frames * self.window, axis=1)
+        power = spectra.real ** 2
+        power += spectra.imag ** 2
+        return (power * self.__scale).astype(np.float32)
+
+    def process(self, iq):
+        data = np.concatenate((self.__tail, np.asarray(iq, np.complex64)))
+        power = self.frames(data)
+        self.__tail = data[len(power) * self.hop:]
+        if len(self.__pending):
+            power = np.concatenate((self.__pending, power))
+        rows = len(power) // self.average
+        self.__pending = power[rows * self.average:]
+        averaged = power[:rows * self.average].reshape(
+            rows, self.average, self.nfft).mean(axis=1)
+        return np.fft.fftshift(averaged, axes=1)
+
+def mean_spectrum(iq, nfft=NFFT, sample_rate=SAMPLE_RATE,
+                  center_freq=FREQUENCY):
+    '''
+    (freqs, power) averaged over all the frames of iq
+    '''
+    spectrogram = Spectrogram(nfft, OVERLAP, 1, sample_rate, center_freq)
+    power = spectrogram.frames(np.asarray(iq, np.complex64)).mean(axis=0)
+    return spectrogram.freqs, np.fft.fftshift(power)
+
+def rank_peaks(freqs, score_db, power_db, count=5, min_separation=0.0):
+    '''
+    the count bins with the highest score_db, at least min_separation Hz
+    apart, best first
+    '''
+    candidates = []
+    for i in np.argsort(score_db)[::-1]:
+        if len(candidates) == count:
+            break
+        if any(abs(freqs[i] - c.frequency) < min_separation
+               for c in candidates):
+            continue
+        candidates.append(Candidate(float(freqs[i]), float(score_db[i]),
+                                    float(power_db[i])))
+    return candidates
+
+def cache_path(path, nfft, overlap, average, sample_rate, center_freq,
+               cache_dir=CACHE_DIR):
+    stat = os.stat(path)
+    key = json.dumps([os.path.abspath(path), stat.st_size, stat.st_mtime_ns,
+                      nfft, overlap, average, sample_rate, center_freq])
+    name = "{}_{}.npz".format(os.path.basename(path),
+                              hashlib.sha1(key.encode()).hexdigest()[:16])
+    return os.path.join(cache_dir, name)
+
+def capture_spectrogram(path, nfft=NFFT, overlap=OVERLAP, average=AVERAGE,
+                        sample_rate=SAMPLE_RATE, center_freq=FREQUENCY,
+                        cache_dir=CACHE_DIR):
+    '''
+    SpectrogramResult of a whole capture file; cache_dir=None skips the
+    cache
+    '''
+    cached = None
+    if cache_dir is not None:
+        cached = cache_path(path, nfft, overlap, average, sample_rate,
+                            center_freq, cache_dir)
+        if os.path.exists(cached):
+            with np.load(cached) as f:
+                return SpectrogramResult(f["power"], f["freqs"], f["times"])
+
+    spectrogram = Spectrogram(nfft, overlap, average, sample_rate,
+                              center_freq)
+    with CaptureReader(path, sample_rate) as capture:
+        rows = [spectrogram.process(chunk) for chunk in capture]
+    power = (np.concatenate(rows) if rows
+             else np.zeros((0, nfft), dtype=np.float32))
+    # each row at the middle of the samples it covers
+    times = ((np.arange(len(power)) + 0.5) * spectrogram.row_seconds
+             + (nfft - spectrogram.hop) / 2 / sample_rate)
+    result = SpectrogramResult(power, spectrogram.freqs, times)
+
+    if cached is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.savez(cached, **result._asdict())
+    return result
+
+def strongest_frequencies(result, count=5):
+    '''
+    (frequency, dB above the median bin) of the count bins that stand out
+    most over the whole capture; emissions that come and go show up in
+    the 99th percentile of each bin even if they are rare
+    '''
+    level = to_db(np.percentile(result.power, 99, axis=0))
+    excess = level - np.median(level)
+    best = np.argsort(excess)[::-1][:count]
+    return [(float(result.freqs[i]), float(excess[i])) for i in best]
+
+def plot_waterfall(result, ax=None):
+    if ax is None:
+        plt.figure()
+        ax = plt.gca()
+    freqs, times = result.freqs / 1e6, result.times
+    ax.imshow(to_db(result.power), aspect='auto', origin='lower',
+              extent=(freqs[0], freqs[-1], times[0] if len(times) else 0,
+                      times[-1] if len(times) else 1))
+    ax.set_title('Spectrogram (dB)')
+    ax.set_xlabel('frequency (MHz)')
+    ax.set_ylabel('time (s)')
+    return ax
+
+def main():
+  parser = argparse.ArgumentParser(description='Waterfall of a raw uint8 I/Q capture, and the frequencies that stand out in it.')
+  parser.add_argument('capture', help='capture file (rtl_sdr format)')
+  parser.add_argument('-f', '--frequency', type=float, default=FREQUENCY, help='center frequency of the capture in Hz (default=%(default)s)')
+  parser.add_argument('-r', '--rate', type=float, default=SAMPLE_RATE, help='capture sample rate (default=%(default)s)')
+  parser.add_argument('-n', '--nfft', type=int, default=NFFT, help='FFT size (default=%(default)s)')
+  parser.add_argument('--overlap', type=float, default=OVERLAP, help='frame overlap, 0..1 (default=%(default)s)')
+  parser.add_argument('--average', type=int, default=AVERAGE, help='spectra averaged per row (default=%(default)s)')
+  parser.add_argument('--no-cache', action='store_true', help='always recompute')
+  parser.add_argument('--no-plot', action='store_true', help='only print the strongest frequencies')
+  args = parser.parse_args()
+
+  result = capture_spectrogram(args.capture, args.nfft, args.overlap,
+                               args.average, args.rate, args.frequency,
+                               None if args.no_cache else CACHE_DIR)
+  for freq, db in strongest_frequencies(result):
+    print("{:.4f} MHz  +{:.1f} dB".format(freq / 1e6, db))
+  if not args.no_plot:
+    plot_waterfall(result)
+    plt.show()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,145 @@
+'''
+Sends arbitrary data as a stream of small, sequenced frames.
+The data (a file, a file object or any iterator of bytes) is read one
+chunk at a time and every chunk is sent as its own preamble + payload
+frame, so nothing larger than a chunk is ever held in memory. Each frame
+payload is
+
+    seq (uint16) | flags (uint8) | length (uint8) | data | crc32 (uint32)
+
+big endian, with FLAG_LAST on the final chunk and the CRC over everything
+before it. Reassembler checks CRCs, drops duplicates (frames are usually
+sent more than once) and writes chunks back out in order.
+'''
+
+import struct
+import zlib
+
+# data bytes per frame; at a few bits per second small frames mean a lost
+# frame costs little
+CHUNK = 32
+
+FLAG_LAST = 0x01
+
+HEADER = struct.Struct(">HBB")
+CRC = struct.Struct(">I")
+
+def iter_chunks(source, chunk=CHUNK):
+    '''
+    source: path, binary file object, bytes or an iterator of bytes
+    '''
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            yield from iter_chunks(f, chunk)
+        return
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = memoryview(source)
+        for i in range(0, len(data), chunk):
+            yield bytes(data[i:i + chunk])
+        return
+    if hasattr(source, "read"):
+        source = iter(lambda f=source: f.read(chunk), b"")
+
+    # deleting from the front of a bytearray does not copy the rest
+    pending = bytearray()
+    for data in source:
+        pending += data
+        while len(pending) >= chunk:
+            yield bytes(pending[:chunk])
+            del pending[:chunk]
+    if pending:
+        yield bytes(pending)
+
+def pack_frame(seq, data, last=False):
+    header = HEADER.pack(seq & 0xffff, FLAG_LAST if last else 0, len(data))
+    body = header + data
+    return body + CRC.pack(zlib.crc32(body))
+
+def unpack_frame(frame):
+    '''
+    (seq, data, last), or None if the frame is cut short or its CRC is
+    wrong
+    '''
+    frame = bytes(frame)
+    if len(frame) < HEADER.size + CRC.size:
+        return None
+    seq, flags, length = HEADER.unpack_from(frame)
+    end = HEADER.size + length
+    if len(frame) < end + CRC.size:
+        return None
+    if CRC.unpack_from(frame, end)[0] != zlib.crc32(frame[:end]):
+        return None
+    return seq, frame[HEADER.size:end], bool(flags & FLAG_LAST)
+
+def iter_frames(source, chunk=CHUNK):
+    '''
+    yields the frame payloads for source, one chunk ahead so the last
+    frame can be flagged
+    '''
+    if chunk > 255:
+        raise ValueError("chunk must fit the uint8 length field")
+    seq = 0
+    previous = None
+    for data in iter_chunks(source, chunk):
+        if previous is not None:
+            yield pack_frame(seq, previous)
+            seq += 1
+        previous = data
+    yield pack_frame(seq, previous or b"", last=True)
+
+def send_stream(source, send, chunk=CHUNK):
+    '''
+    sends every frame of source with send(payload), e.g. a Transmitter's
+    submit or lambda p: modulator.send_code(encoder.encode(p), fm);
+    returns the number of frames
+    '''
+    frames = 0
+    for frame in iter_frames(source, chunk):
+        send(frame)
+        frames += 1
+    return frames
+
+class Reassembler:
+    """
+    Puts received frame payloads back together. write is called with each
+    chunk in order as soon as it can be; out of order frames wait in a
+    buffer. Bad and duplicate frames are counted and dropped.
+    Sequence numbers are 16 bit, so at most 65536 frames may be in flight.
+
+    """
+    def __init__(self, write):
+        self.write = write
+        self.next_seq = 0
+        self.done = False
+        self.bad_frames = 0
+        self.duplicates = 0
+        # keyed by unwrapped sequence number
+        self.__pending = {}
+        self.__last_seq = None
+
+    def add(self, frame):
+        '''
+        returns True once the whole stream has been written
+        '''
+        unpacked = unpack_frame(frame)
+        if unpacked is None:
+            self.bad_frames += 1
+            return self.done
+        seq, data, last = unpacked
+        # sequence numbers wrap; anything more than half the range ahead
+        # is really behind, i.e. already written
+        ahead = (seq - self.next_seq) & 0xffff
+        seq = self.next_seq + ahead
+        if self.done or ahead >= 0x8000 or seq in self.__pending:
+            self.duplicates += 1
+            return self.done
+        self.__pending[seq] = data
+        if last:
+            self.__last_seq = seq
+
+        while self.next_seq in self.__pending:
+            self.write(self.__pending.pop(self.next_seq))
+            if self.next_seq == self.__last_seq:
+                self.done = True
+            self.next_seq += 1
+        return self.done
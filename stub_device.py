@@ -0,0 +1,60 @@
+'''
+Stand-in for FMDevice, for running the transmit side without a sensor.
+A StubFMDevice has the same pulse/cancel/close interface; a pulse just
+blocks for as long as a real burst with the same timeout would (the delay
+table in modulator.py, interpolated) and returns ABS_STATUS_TIMEOUT, or
+ABS_STATUS_CANCELED when cancel() is called from another thread.
+'''
+
+import itertools
+import threading
+
+import numpy as np
+from fprint_codes import (ABS_MSG_PROCESS_PROGRESS, ABS_STATUS_CANCELED,
+                          ABS_STATUS_NO_SUCH_OPERATION, ABS_STATUS_OK,
+                          ABS_STATUS_TIMEOUT)
+
+# the delay table in modulator.py: timeout -> burst length in ms
+DELAY_TIMEOUTS = [1, 100, 250, 460, 500, 1000]
+DELAY_MS = [40, 171, 276, 480, 586, 1081]
+
+_operation_ids = itertools.count(1)
+
+def enumerate_stub_devices(count):
+    return [b"stub" + str(i).encode() for i in range(count)]
+
+class StubFMDevice:
+    def __init__(self, t, dsn=b"stub0"):
+        self.dsn = dsn
+        self.operation_id = 0
+        self.last_message = 0
+        self.messages = 0
+        self.pulses = 0
+        self.__cancelled = threading.Event()
+        self.set_timeout(t)
+
+    def set_timeout(self, t):
+        self.timeout = t
+        self.burst_ms = float(np.interp(t, DELAY_TIMEOUTS, DELAY_MS))
+
+    def pulse(self):
+        self.operation_id = next(_operation_ids)
+        self.__cancelled.clear()
+        self.pulses += 1
+        self.last_message = ABS_MSG_PROCESS_PROGRESS
+        self.messages = 1
+        if self.__cancelled.wait(self.burst_ms / 1000.0):
+            return ABS_STATUS_CANCELED
+        return ABS_STATUS_TIMEOUT
+
+    def test(self):
+        return self.pulse()
+
+    def cancel(self):
+        if self.operation_id == 0:
+            return ABS_STATUS_NO_SUCH_OPERATION
+        self.__cancelled.set()
+        return ABS_STATUS_OK
+
+    def close(self):
+        pass
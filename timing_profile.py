@@ -0,0 +1,90 @@
+'''
+Measured pulse timing, saved by calibrate.py and loaded by the modulator.
+The profile maps each ABSGrabImage timeout to the distribution of burst
+durations seen for it (the automated version of the delay table in
+modulator.py), and symbol_period_for turns that into a symbol period.
+Timeouts between two calibrated ones get their values interpolated.
+'''
+
+import bisect
+import json
+import os
+import platform
+import time
+
+import numpy as np
+from scheduler import SYMBOL_PERIOD_MS
+
+PROFILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "timing_profile.json")
+
+# symbol period = p99 burst length * SYMBOL_MARGIN
+SYMBOL_MARGIN = 1.1
+
+def summarize(durations_ns):
+    ms = np.asarray(durations_ns, dtype=np.float64) / 1e6
+    p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+    return {"count": int(ms.size),
+            "mean_ms": float(ms.mean()),
+            "std_ms": float(ms.std()),
+            "min_ms": float(ms.min()),
+            "p50_ms": float(p50),
+            "p90_ms": float(p90),
+            "p99_ms": float(p99),
+            "max_ms": float(ms.max())}
+
+def save_profile(timeouts, path=PROFILE_PATH):
+    '''
+    timeouts: {timeout: summarize(...)}
+    '''
+    profile = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "host": platform.node(),
+               "timeouts": {str(t): stats for t, stats in
+                            sorted(timeouts.items())}}
+    with open(path, "w") as f:
+        json.dump(profile, f, indent=2)
+    return profile
+
+def load_profile(path=PROFILE_PATH):
+    '''
+    returns the saved profile, or None if nothing has been calibrated
+    '''
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def pulse_stats(profile, timeout):
+    '''
+    burst stats for timeout; between two calibrated timeouts every *_ms
+    value is interpolated linearly, outside the calibrated range there
+    are none
+    '''
+    if not profile:
+        return None
+    timeouts = profile["timeouts"]
+    if str(timeout) in timeouts:
+        return timeouts[str(timeout)]
+    calibrated = sorted(int(t) for t in timeouts)
+    if not calibrated or not calibrated[0] < timeout < calibrated[-1]:
+        return None
+    i = bisect.bisect(calibrated, timeout)
+    below, above = calibrated[i - 1], calibrated[i]
+    w = (timeout - below) / (above - below)
+    a, b = timeouts[str(below)], timeouts[str(above)]
+    return {k: a[k] + w * (b[k] - a[k]) for k in a if k.endswith("_ms")}
+
+def symbol_period_for(profile, timeout, margin=SYMBOL_MARGIN):
+    '''
+    shortest symbol period (ms) that fits p99 of the bursts for timeout;
+    falls back to SYMBOL_PERIOD_MS, with a warning if there is a profile,
+    when timeout is outside the calibrated range
+    '''
+    stats = pulse_stats(profile, timeout)
+    if stats is None:
+        if profile:
+            print("Timeout {} is not covered by the timing profile, using "
+                  "{} ms symbols; run calibrate.py -t {}".format(
+                      timeout, SYMBOL_PERIOD_MS, timeout))
+        return SYMBOL_PERIOD_MS
+    return stats["p99_ms"] * margin
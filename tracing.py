@@ -0,0 +1,92 @@
+'''
+Per-symbol transmit trace.
+Every keyed pulse is written into a preallocated NumPy ring buffer: when it
+was scheduled, when the BSAPI call actually started and ended, the status
+it returned and the last callback message. Nothing is printed or allocated
+while transmitting; the trace is looked at afterwards with summary(),
+histogram(), or saved with save_npy()/save_json().
+'''
+
+import json
+
+import numpy as np
+
+# pulses kept before the oldest are overwritten
+CAPACITY = 1 << 16
+
+TRACE_DTYPE = np.dtype([("seq", np.uint64),
+                        ("scheduled_ns", np.int64),
+                        ("start_ns", np.int64),
+                        ("end_ns", np.int64),
+                        ("status", np.int32),
+                        ("message", np.uint32),
+                        ("messages", np.uint32)])
+
+class SymbolTrace:
+    """
+    Ring buffer of TRACE_DTYPE records. record() only stores into the
+    next slot; records() returns what is kept, oldest first.
+
+    """
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=TRACE_DTYPE)
+        self.count = 0
+
+    def record(self, scheduled_ns, start_ns, end_ns, status, message=0,
+               messages=0):
+        self.buffer[self.count % self.capacity] = (
+            self.count, scheduled_ns, start_ns, end_ns, status, message,
+            messages)
+        self.count += 1
+
+    def clear(self):
+        self.count = 0
+
+    def records(self):
+        if self.count <= self.capacity:
+            return self.buffer[:self.count].copy()
+        split = self.count % self.capacity
+        return np.concatenate((self.buffer[split:], self.buffer[:split]))
+
+    def lateness_us(self, records=None):
+        r = self.records() if records is None else records
+        return (r["start_ns"] - r["scheduled_ns"]) / 1000.0
+
+    def duration_ms(self, records=None):
+        r = self.records() if records is None else records
+        return (r["end_ns"] - r["start_ns"]) / 1e6
+
+    def histogram(self, bins=50, field="lateness"):
+        '''
+        (counts, bin edges) of start lateness in us, or of pulse duration
+        in ms with field="duration"
+        '''
+        values = (self.duration_ms() if field == "duration"
+                  else self.lateness_us())
+        return np.histogram(values, bins)
+
+    def summary(self):
+        r = self.records()
+        if not len(r):
+            return "no pulses traced"
+        late = self.lateness_us(r)
+        duration = self.duration_ms(r)
+        return ("{} pulses ({} dropped), start lateness p50 {:.1f} us "
+                "p99 {:.1f} us max {:.1f} us, duration p50 {:.2f} ms "
+                "p99 {:.2f} ms").format(
+                    len(r), self.count - len(r), np.percentile(late, 50),
+                    np.percentile(late, 99), late.max(),
+                    np.percentile(duration, 50),
+                    np.percentile(duration, 99))
+
+    def save_npy(self, path):
+        np.save(path, self.records())
+
+    def save_json(self, path):
+        r = self.records()
+        with open(path, "w") as f:
+            json.dump({name: r[name].tolist() for name in r.dtype.names}, f)
+
+def load_npy(path):
+    return np.load(path)
@@ -0,0 +1,175 @@
+'''
+Non-blocking front end for the modulator.
+A Transmitter owns one FMDevice and a worker thread. submit() queues a
+payload and returns a concurrent.futures.Future right away; the worker
+keys the queued frames one after another, lowest priority number first
+and in submission order within a priority. asyncio code can await the
+future with asyncio.wrap_future().
+cancel() aborts the frame on air from any thread, and a payload submitted
+with a deadline is aborted when it has not finished by then; in both cases
+the running grab is stopped with ABSCancelOperation and the future fails
+with TransmitCancelled.
+'''
+
+from concurrent.futures import Future
+import itertools
+import math
+import queue
+import threading
+import time
+
+from frame_encoder import BARKER_13, FrameEncoder
+from line_codes import OOK
+from modulator import FMDevice, PULSE_TIMEOUT
+from scheduler import SymbolScheduler, TransmitCancelled
+from timing_profile import load_profile, symbol_period_for
+
+# default bound on queued payloads
+MAX_QUEUE = 16
+
+# pause between repeats of one payload, as in modulator.main()
+REPEAT_GAP_MS = 250
+
+class Transmitter:
+    """
+    Background transmitter.
+    fm is opened with FMDevice(timeout) unless one is passed in. When
+    max_queue payloads are waiting, submit() blocks (block=True, up to
+    timeout seconds) or raises queue.Full. Pulses are recorded in trace
+    (a tracing.SymbolTrace) when one is given.
+
+    """
+    def __init__(self, fm=None, timeout=PULSE_TIMEOUT, line_code=None,
+                 fec_depth=None, preamble=BARKER_13, max_queue=MAX_QUEUE,
+                 trace=None):
+        self.fm = fm if fm is not None else FMDevice(timeout)
+        if line_code is None:
+            # calibrated for the timeout fm was actually opened with
+            line_code = OOK(symbol_period_for(load_profile(),
+                                              self.fm.timeout))
+        self.encoder = FrameEncoder(preamble, line_code, fec_depth)
+        self.scheduler = SymbolScheduler(self.fm, trace=trace)
+        self.sent = 0
+        # monotonic_ns end of the last frame sent
+        self.last_end_ns = 0
+        self.__queue = queue.PriorityQueue(max_queue)
+        self.__order = itertools.count()
+        self.__closed = False
+        self.__current = None
+        self.__lock = threading.Lock()
+        # a Transmitter nobody closed does not keep the interpreter alive;
+        # close() (or with) sends what is queued first
+        self.__worker = threading.Thread(target=self.__run,
+                                         name="transmitter", daemon=True)
+        self.__worker.start()
+
+    def qsize(self):
+        return self.__queue.qsize()
+
+    def submit(self, payload, priority=0, repeats=1, block=True,
+               timeout=None, deadline_ns=None, start_ns=None):
+        """
+        Queues payload (bytes or uint8 values) to be sent repeats times,
+        finishing before the time.monotonic_ns() deadline_ns if given.
+        start_ns pins the start of the first frame; it may also be a
+        callable, called by the worker when it picks the payload up with
+        the time its previous frame ended and returning the start, e.g. to
+        line up several transmitters (multi_transmitter.SharedStart). By
+        default it starts as soon as the worker gets to it.
+        The future's result is the monotonic_ns time the last frame ended.
+
+        """
+        if self.__closed:
+            raise RuntimeError("transmitter is closed")
+        future = Future()
+        item = (payload, repeats, deadline_ns, start_ns, future)
+        self.__queue.put((priority, next(self.__order), item), block,
+                         timeout)
+        return future
+
+    def cancel(self, pending=False):
+        """
+        Aborts the frame being sent; with pending=True the queued payloads
+        are cancelled too.
+
+        """
+        if pending:
+            while True:
+                try:
+                    priority, order, item = self.__queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    # keep the stop request of close()
+                    self.__queue.put((priority, order, item))
+                    break
+                item[-1].cancel()
+        self.__abort(None)
+
+    def __abort(self, future):
+        # future=None aborts whatever is on air
+        with self.__lock:
+            if self.__current is not None and future in (None,
+                                                         self.__current):
+                self.scheduler.cancel()
+
+    def close(self, wait=True):
+        """
+        Stops the worker once everything already queued has been sent.
+
+        """
+        if not self.__closed:
+            self.__closed = True
+            self.__queue.put((math.inf, next(self.__order), None))
+        if wait:
+            self.__worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def send(self, payload, repeats, start_ns=None):
+        end_ns = None
+        for i in range(repeats):
+            if i:
+                start_ns = end_ns + REPEAT_GAP_MS * 1000000
+            end_ns = self.scheduler.send_schedule(
+                *self.encoder.schedule(payload), start_ns=start_ns)
+        self.sent += 1
+        return end_ns
+
+    def __run(self):
+        while True:
+            priority, order, item = self.__queue.get()
+            if item is None:
+                break
+            payload, repeats, deadline_ns, start_ns, future = item
+            # skipped if the caller cancelled it while it was queued
+            if not future.set_running_or_notify_cancel():
+                continue
+            watchdog = None
+            if deadline_ns is not None:
+                remaining = (deadline_ns - time.monotonic_ns()) / 1e9
+                if remaining <= 0:
+                    future.set_exception(TransmitCancelled("deadline passed"))
+                    continue
+                watchdog = threading.Timer(remaining, self.__abort, (future,))
+            with self.__lock:
+                self.scheduler.reset()
+                self.__current = future
+            if watchdog:
+                watchdog.start()
+            try:
+                if callable(start_ns):
+                    start_ns = start_ns(self.last_end_ns)
+                self.last_end_ns = self.send(payload, repeats, start_ns)
+                future.set_result(self.last_end_ns)
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                if watchdog:
+                    watchdog.cancel()
+                with self.__lock:
+                    self.__current = None
@@ -0,0 +1,214 @@
+'''
+Long running transmitter that keeps the BSAPI session open.
+The daemon opens the sensor once and accepts payloads on a local Unix
+socket, so a request starts keying right away instead of paying for
+loading libbsapi, ABSInitialize, ABSOpen and ABSListImageFormats first.
+If the USB session drops, the device is reopened and the pulse retried.
+The socket is only accessible to the user running the daemon, and a
+second daemon on the same path refuses to start.
+
+Protocol, one request per connection:
+    client: "SEND <priority> <repeats>\\n" followed by the payload bytes,
+            then shuts down its write side
+    daemon: "OK <end_ns>\\n" once the payload has been sent, or
+            "ERR <reason>\\n"
+send() below is the client side.
+'''
+
+import argparse
+import os
+import socket
+import socketserver
+import threading
+
+from fprint_codes import (ABS_STATUS_CANCELED, ABS_STATUS_INVALID_HANDLE,
+                          ABS_STATUS_NO_SUCH_DEVICE, ABS_STATUS_NOT_INITIALIZED,
+                          ABS_STATUS_REMOTE_COMM_ERROR)
+from modulator import FMDevice, PULSE_TIMEOUT
+from transmitter import Transmitter
+
+SOCKET_PATH = "/tmp/fprint_transmitter.sock"
+
+# statuses after which the session has to be opened again
+SESSION_LOST = (ABS_STATUS_INVALID_HANDLE, ABS_STATUS_NO_SUCH_DEVICE,
+                ABS_STATUS_NOT_INITIALIZED, ABS_STATUS_REMOTE_COMM_ERROR)
+
+# wait between attempts to reopen the device, in seconds, and how many
+# attempts are made before the pulse fails
+RECONNECT_DELAY = 1.0
+RECONNECT_ATTEMPTS = 30
+
+class ReconnectingDevice:
+    """
+    FMDevice that reopens itself when a pulse reports a lost session.
+    The pulse is retried once on the new session. Reopening happens
+    outside the lock, so cancel() stays responsive: it interrupts the
+    reconnect loop, and the next pulse tries again.
+
+    """
+    def __init__(self, timeout=PULSE_TIMEOUT, open_device=FMDevice):
+        self.timeout = timeout
+        self.open_device = open_device
+        self.reconnects = 0
+        self.__lock = threading.Lock()
+        self.__interrupt = threading.Event()
+        self.__fm = open_device(timeout)
+
+    def __reopen(self):
+        '''
+        returns False if cancel() interrupted it; raises RuntimeError
+        after RECONNECT_ATTEMPTS failed attempts
+        '''
+        with self.__lock:
+            fm, self.__fm = self.__fm, None
+        if fm is not None:
+            fm.close()
+        for attempt in range(RECONNECT_ATTEMPTS):
+            if self.__interrupt.is_set():
+                return False
+            try:
+                fm = self.open_device(self.timeout)
+            except SystemExit:
+                # check_call exits on a failed ABSInitialize/ABSOpen;
+                # try again until the sensor is back
+                self.__interrupt.wait(RECONNECT_DELAY)
+                continue
+            with self.__lock:
+                self.__fm = fm
+            self.reconnects += 1
+            return True
+        raise RuntimeError("device not back after {} attempts".format(
+            RECONNECT_ATTEMPTS))
+
+    def set_timeout(self, t):
+        self.timeout = t
+        with self.__lock:
+            if self.__fm is not None:
+                self.__fm.set_timeout(t)
+
+    def pulse(self):
+        self.__interrupt.clear()
+        # still closed after an interrupted or failed reopen
+        if self.__fm is None and not self.__reopen():
+            return ABS_STATUS_CANCELED
+        status = self.__pulse()
+        if status in SESSION_LOST:
+            print("Session lost, reopening the device")
+            if not self.__reopen():
+                return ABS_STATUS_CANCELED
+            status = self.__pulse()
+        return status
+
+    def __pulse(self):
+        fm = self.__fm
+        # closed from another thread meanwhile
+        return fm.pulse() if fm is not None else ABS_STATUS_CANCELED
+
+    def cancel(self):
+        self.__interrupt.set()
+        with self.__lock:
+            if self.__fm is None:
+                return ABS_STATUS_CANCELED
+            return self.__fm.cancel()
+
+    def close(self):
+        self.__interrupt.set()
+        with self.__lock:
+            fm, self.__fm = self.__fm, None
+        if fm is not None:
+            fm.close()
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            # a connect-only probe (in_use)
+            return
+        try:
+            command, priority, repeats = line.split()
+            if command != b"SEND":
+                raise ValueError("unknown command")
+            payload = self.rfile.read()
+            future = self.server.transmitter.submit(
+                payload, int(priority), int(repeats))
+            reply = "OK {}\n".format(future.result())
+        except Exception as e:
+            reply = "ERR {}\n".format(e)
+        self.wfile.write(reply.encode())
+
+class TransmitterDaemon(socketserver.ThreadingMixIn,
+                        socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, transmitter, path=SOCKET_PATH):
+        self.transmitter = transmitter
+        if os.path.exists(path):
+            if in_use(path):
+                raise OSError("another daemon is listening on " + path)
+            # left behind by a daemon that did not shut down cleanly
+            os.unlink(path)
+        socketserver.UnixStreamServer.__init__(self, path, RequestHandler)
+
+    def server_bind(self):
+        # created owner only (0600), so other users cannot key the sensor
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+def in_use(path):
+    '''
+    whether a daemon accepts connections on path
+    '''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(path)
+        except OSError:
+            return False
+    return True
+
+def send(payload, priority=0, repeats=1, path=SOCKET_PATH):
+    '''
+    hands payload to a running daemon and returns its reply line
+    '''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(path)
+        s.sendall("SEND {} {}\n".format(priority, repeats).encode())
+        s.sendall(bytes(payload))
+        s.shutdown(socket.SHUT_WR)
+        return s.makefile("rb").readline().decode().strip()
+
+def main():
+  parser = argparse.ArgumentParser(description='Keep the fingerprint sensor open and transmit payloads received on a Unix socket.')
+  parser.add_argument('-s', '--socket', default=SOCKET_PATH, help='socket path (default=%(default)s)')
+  parser.add_argument('-t', '--timeout', type=int, default=PULSE_TIMEOUT, help='pulse timeout (default=%(default)s)')
+  parser.add_argument('--fec-depth', type=int, default=None, help='interleaver depth to enable FEC')
+  parser.add_argument('--max-queue', type=int, default=16, help='payloads waiting before clients block (default=16)')
+  args = parser.parse_args()
+  if in_use(args.socket):
+    parser.error("another daemon is listening on " + args.socket)
+
+  fm = ReconnectingDevice(args.timeout)
+  transmitter = Transmitter(fm, args.timeout, fec_depth=args.fec_depth,
+                            max_queue=args.max_queue)
+  server = TransmitterDaemon(transmitter, args.socket)
+  print("Listening on", args.socket)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+    transmitter.cancel(pending=True)
+    transmitter.close()
+    fm.close()
+
+
+if __name__ == '__main__':
+  main()